@@ -0,0 +1,38 @@
+"""
+Microbenchmark of the per-URL cost of signing S3 requests
+
+    python benchmarks/bench_presign.py [-n NUMBER]
+"""
+
+import argparse
+import os
+import timeit
+
+from boto3utils.s3 import Presigner, get_presigned_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--number", type=int, default=10000)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "AKIDEXAMPLE")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "secret")
+    urls = ["s3://bucket/prefix/%08d/asset.tif" % i for i in range(args.number)]
+
+    def presigned_url():
+        for url in urls:
+            get_presigned_url(url)
+
+    presigner = Presigner.from_env()
+
+    def sign_many():
+        presigner.sign_many(urls)
+
+    for name, fn in [("get_presigned_url", presigned_url), ("sign_many", sign_many)]:
+        seconds = min(timeit.repeat(fn, number=1, repeat=3))
+        print("%-20s %8.2f us/url" % (name, 1e6 * seconds / args.number))
+
+
+if __name__ == "__main__":
+    main()
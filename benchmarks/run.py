@@ -0,0 +1,332 @@
+"""
+Benchmarks of the s3 and inventory hot paths, run offline against moto
+
+    python benchmarks/run.py [--objects N] [--rows N] [--save FILE] [--compare FILE]
+
+Each operation is run --repeat times against a synthetic bucket and inventory,
+reporting throughput (items/s), latency percentiles and peak memory (from a
+separate, traced run). Latencies are of each read, presign and listing request
+where a benchmark times them (see timed()), otherwise of whole runs. --save stores the results as a baseline that a
+later run can --compare against, failing if any operation got slower than the
+baseline by more than --threshold.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from shutil import rmtree
+
+import boto3
+import moto
+
+from boto3utils import s3
+from boto3utils.s3 import Presigner, clear_clients
+from boto3utils.s3inventory import S3Inventory
+
+BUCKET = "benchmark-bucket"
+INVENTORY_BUCKET = "benchmark-inventory"
+INVENTORY_PREFIX = "benchmark-bucket/daily"
+INVENTORY_DATE = "2024-01-01"
+SCHEMA = "Bucket, Key, Size, LastModifiedDate, ETag, StorageClass, IsLatest"
+
+BENCHMARKS = {}
+
+
+def benchmark(fn):
+    """
+    Register a benchmark: fn(ctx) runs the operation once, returning the items
+    or the number of items
+    """
+    BENCHMARKS[fn.__name__] = fn
+    return fn
+
+
+def timed(ctx, fn, *args, **kwargs):
+    """Call fn, recording its latency for the percentiles of the benchmark"""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    ctx["latencies"].append(time.perf_counter() - start)
+    return result
+
+
+def time_requests(client, operation, ctx):
+    """Record the latency of each request for an operation made by a client"""
+
+    def before(context, **kwargs):
+        context["benchmark_start"] = time.perf_counter()
+
+    def after(context, **kwargs):
+        ctx["latencies"].append(time.perf_counter() - context["benchmark_start"])
+
+    client.meta.events.register(f"before-call.s3.{operation}", before)
+    client.meta.events.register(f"after-call.s3.{operation}", after)
+
+
+def create_bucket(client, objects):
+    client.create_bucket(Bucket=BUCKET)
+    for i in range(objects):
+        client.put_object(
+            Bucket=BUCKET,
+            Key="data/%02d/%06d.json" % (i % 16, i),
+            Body=json.dumps({"id": i, "values": list(range(20))}),
+        )
+
+
+def inventory_rows(rows, start=0):
+    for i in range(start, start + rows):
+        yield '"%s","data/%02d/%06d/item.json","%s","2023-%02d-%02dT12:00:00.000Z","%032x","STANDARD","true"' % (  # noqa: E501
+            BUCKET,
+            i % 16,
+            i,
+            i * 10,
+            1 + i % 12,
+            1 + i % 28,
+            i,
+        )
+
+
+def create_inventory(client, rows, files):
+    client.create_bucket(Bucket=INVENTORY_BUCKET)
+    keys = []
+    per_file = rows // files
+    for n in range(files):
+        key = "%s/data/%04d.csv.gz" % (INVENTORY_PREFIX, n)
+        body = "\n".join(inventory_rows(per_file, n * per_file)) + "\n"
+        client.put_object(
+            Bucket=INVENTORY_BUCKET, Key=key, Body=gzip.compress(body.encode())
+        )
+        keys.append({"key": key, "size": len(body)})
+    manifest = {
+        "sourceBucket": BUCKET,
+        "destinationBucket": "arn:aws:s3:::" + INVENTORY_BUCKET,
+        "fileFormat": "CSV",
+        "fileSchema": SCHEMA,
+        "files": keys,
+    }
+    client.put_object(
+        Bucket=INVENTORY_BUCKET,
+        Key="%s/%sT01-00Z/manifest.json" % (INVENTORY_PREFIX, INVENTORY_DATE),
+        Body=json.dumps(manifest),
+    )
+
+
+@benchmark
+def urlparse(ctx):
+    sys.modules["boto3utils.s3"]._parse_url.cache_clear()
+    return [s3.urlparse(url) for url in ctx["urls"]]
+
+
+@benchmark
+def find(ctx):
+    return list(ctx["s3"].find("s3://%s/data/" % BUCKET))
+
+
+@benchmark
+def find_objects(ctx):
+    return list(ctx["s3"].find_objects("s3://%s/data/" % BUCKET))
+
+
+@benchmark
+def find_parallel(ctx):
+    return list(ctx["s3"].find_parallel("s3://%s/data/" % BUCKET))
+
+
+@benchmark
+def read(ctx):
+    return [timed(ctx, ctx["s3"].read, url) for url in ctx["urls"][:200]]
+
+
+@benchmark
+def read_json(ctx):
+    return [timed(ctx, ctx["s3"].read_json, url) for url in ctx["urls"][:200]]
+
+
+@benchmark
+def download_many(ctx):
+    results = ctx["s3"].download_many(ctx["urls"][:200], ctx["tmpdir"])
+    return [fname for _, fname, _ in results]
+
+
+@benchmark
+def iter_lines(ctx):
+    return list(ctx["s3"].iter_lines(ctx["inventory"].inventory_file_hrefs()[0]))
+
+
+@benchmark
+def read_inventory_file(ctx):
+    inv = ctx["inventory"]
+    rows = []
+    for href in inv.inventory_file_hrefs():
+        rows.extend(inv.read_inventory_file(href, inv.schema, s3client=inv.s3client))
+    return rows
+
+
+@benchmark
+def filter_inventory_file(ctx):
+    inv = ctx["inventory"]
+    urls = []
+    for href in inv.inventory_file_hrefs():
+        urls.extend(
+            inv.filter_inventory_file(
+                href,
+                inv.schema,
+                s3client=inv.s3client,
+                prefix="data/0",
+                suffix=".json",
+                start_date=datetime(2023, 3, 1).date(),
+            )
+        )
+    return urls
+
+
+@benchmark
+def filter_inventory_rows(ctx):
+    """Inventory rows read and filtered per second, with every filter"""
+    inv = ctx["inventory"]
+    for href in inv.inventory_file_hrefs():
+        for _ in inv.filter_inventory_file(
+            href,
+            inv.schema,
+            s3client=inv.s3client,
+            prefix="data/0",
+            suffix=".json",
+            start_date=datetime(2023, 3, 1).date(),
+            end_date=datetime(2023, 11, 1).date(),
+            is_latest=True,
+            key_contains=["/item"],
+        ):
+            pass
+    return ctx["rows"]
+
+
+@benchmark
+def presign(ctx):
+    presigner = ctx["presigner"]
+    return [timed(ctx, presigner.sign, url) for url in ctx["urls"]]
+
+
+def run(name, ctx, repeat):
+    fn = BENCHMARKS[name]
+    fn(ctx)  # warm up
+    times = []
+    latencies = []
+    items = 0
+    for _ in range(repeat):
+        ctx["latencies"] = []
+        start = time.perf_counter()
+        result = fn(ctx)
+        items = result if isinstance(result, int) else len(result)
+        times.append(time.perf_counter() - start)
+        latencies.extend(ctx["latencies"])
+
+    tracemalloc.start()
+    fn(ctx)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # per operation latencies if the benchmark timed them, else whole runs
+    samples = latencies or times
+    quantiles = (
+        statistics.quantiles(samples, n=100) if len(samples) > 1 else samples * 99
+    )
+    return {
+        "items": items,
+        "throughput": items / statistics.median(times),
+        "p50_ms": 1000 * statistics.median(samples),
+        "p95_ms": 1000 * quantiles[94],
+        "p99_ms": 1000 * quantiles[98],
+        "peak_memory_mb": peak / 1024**2,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Get the operations whose throughput dropped more than threshold"""
+    slower = []
+    for name, result in results.items():
+        if name in baseline:
+            ratio = result["throughput"] / baseline[name]["throughput"]
+            if ratio < 1 - threshold:
+                slower.append((name, ratio))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--objects", type=int, default=1000, help="Objects in bucket")
+    parser.add_argument("--rows", type=int, default=100000, help="Inventory rows")
+    parser.add_argument("--files", type=int, default=4, help="Inventory files")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of each operation")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS))
+    parser.add_argument("--save", help="Save results as a baseline JSON file")
+    parser.add_argument("--compare", help="Compare results to a baseline JSON file")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="Allowed throughput drop"
+    )
+    args = parser.parse_args()
+
+    for var in ["AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"]:
+        os.environ[var] = "benchmark"
+    os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+
+    results = {}
+    with moto.mock_s3():
+        clear_clients()
+        client = boto3.client("s3")
+        create_bucket(client, args.objects)
+        create_inventory(client, args.rows, args.files)
+        _s3 = s3(max_pool_connections=20)
+        ctx = {
+            "s3": _s3,
+            "urls": list(_s3.find("s3://%s/data/" % BUCKET)),
+            "inventory": S3Inventory(
+                "s3://%s/%s" % (INVENTORY_BUCKET, INVENTORY_PREFIX),
+                date=INVENTORY_DATE,
+            ),
+            "rows": args.rows // args.files * args.files,
+            "presigner": Presigner("AKIDEXAMPLE", "secret"),
+            "tmpdir": tempfile.mkdtemp(),
+            "latencies": [],
+        }
+        # each page of the listing benchmarks is one request
+        time_requests(_s3.s3, "ListObjectsV2", ctx)
+        print(
+            "%-22s %8s %12s %10s %10s %10s %10s"
+            % ("operation", "items", "items/s", "p50 ms", "p95 ms", "p99 ms", "peak MB")
+        )
+        for name in args.only or BENCHMARKS:
+            result = results[name] = run(name, ctx, args.repeat)
+            print(
+                "%-22s %8d %12.0f %10.2f %10.2f %10.2f %10.2f"
+                % (
+                    name,
+                    result["items"],
+                    result["throughput"],
+                    result["p50_ms"],
+                    result["p95_ms"],
+                    result["p99_ms"],
+                    result["peak_memory_mb"],
+                )
+            )
+        rmtree(ctx["tmpdir"])
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(results, json.load(f), args.threshold)
+        for name, ratio in slower:
+            print("SLOWER: %s at %.0f%% of baseline throughput" % (name, 100 * ratio))
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Optional
+
+from boto3utils.s3 import DEFAULT_MAX_WORKERS, s3
+
+logger = logging.getLogger(__name__)
+
+# returned by next() when a page generator is exhausted
+_DONE = object()
+
+
+class AsyncS3(object):
+    """
+    asyncio interface mirroring the s3 class
+
+    Requests are made by an s3 object on a dedicated thread pool, so at most
+    max_concurrency of them run at once however many coroutines are waiting.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_MAX_WORKERS,
+        executor: Optional[ThreadPoolExecutor] = None,
+        **kwargs,
+    ):
+        """
+        :param max_concurrency: Number of requests run at the same time
+        :param executor: Thread pool to run requests on, created if not given
+        :param kwargs: Passed to s3 (session, requester_pays, endpoint_url, ...)
+        """
+        kwargs.setdefault("max_pool_connections", max_concurrency)
+        self.s3 = s3(**kwargs)
+        self.max_concurrency = max_concurrency
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="boto3utils"
+        )
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Shut down the thread pool, if it was created by this object"""
+        if self._own_executor:
+            self.executor.shutdown(wait=False)
+
+    async def _run(self, fn, *args, **kwargs):
+        # created here rather than in __init__ to bind it to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            return await loop.run_in_executor(
+                self.executor, partial(fn, *args, **kwargs)
+            )
+
+    async def exists(self, url) -> bool:
+        """Check if this URL exists on S3"""
+        return await self._run(self.s3.exists, url)
+
+    async def read(self, url) -> str:
+        """Read object from s3"""
+        return await self._run(self.s3.read, url)
+
+    async def read_json(self, url):
+        """Download object from S3 as JSON"""
+        return await self._run(self.s3.read_json, url)
+
+    async def upload(self, filename, url, **kwargs) -> str:
+        """Upload object to S3 uri, see s3.upload"""
+        return await self._run(self.s3.upload, filename, url, **kwargs)
+
+    async def upload_json(self, data, url, **kwargs) -> Optional[str]:
+        """Upload dictionary as JSON to URL, see s3.upload_json"""
+        return await self._run(self.s3.upload_json, data, url, **kwargs)
+
+    async def download(self, uri, path="", **kwargs) -> str:
+        """Download object from S3, see s3.download"""
+        return await self._run(self.s3.download, uri, path, **kwargs)
+
+    async def delete(self, url):
+        """Remove object from S3"""
+        return await self._run(self.s3.delete, url)
+
+    async def find(self, url, suffix="") -> AsyncIterator[str]:
+        """
+        Generate objects in an S3 bucket, one listing page request at a time.
+        :param url: The beginning part of the URL to match (bucket + optional prefix)
+        :param suffix: Only fetch objects whose keys end with this suffix.
+        """
+        parts = self.s3.urlparse(url)
+        pages = self.s3._list_pages(parts["bucket"], parts["key"])
+        while True:
+            resp = await self._run(next, pages, _DONE)
+            if resp is _DONE:
+                return
+            for obj in resp.get("Contents", []):
+                key = obj["Key"]
+                if key.startswith(parts["key"]) and key.endswith(suffix):
+                    yield f"s3://{parts['bucket']}/{key}"
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import logging
+import os
+import os.path as op
+import threading
+import time
+from shutil import copyfileobj
+from tempfile import NamedTemporaryFile
+from typing import IO, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class S3Cache(object):
+    """
+    Size-bounded local read-through cache of S3 objects
+
+    Objects are stored in a directory, keyed by bucket, key and version, and
+    evicted least recently used first when the total size goes over max_bytes.
+    Cached objects are revalidated with a conditional GET (If-None-Match) unless
+    they were checked less than ttl seconds ago; objects requested by version
+    never change and are not revalidated.
+
+    Entries are written to temporary files and renamed into place, so several
+    processes can share the same directory. Each process keeps a running total
+    of the cache size, counting what it fetches, and only scans the directory
+    to evict entries when the total goes over max_bytes; the total is brought
+    up to date, including entries added by other processes, by each scan.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 1024**3, ttl: float = 0):
+        """
+        :param path: Directory of the cache, created if needed
+        :param max_bytes: Total size of cached objects to keep
+        :param ttl: Seconds during which a cached object is used without
+            revalidation
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # total size of cached objects, unknown until the first eviction scan
+        self._size = None
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _entry(self, bucket, key, version_id=None) -> str:
+        name = "%s/%s?%s" % (bucket, key, version_id or "")
+        return op.join(self.path, hashlib.sha256(name.encode("utf-8")).hexdigest())
+
+    @staticmethod
+    def _load(fname) -> Optional[dict]:
+        try:
+            with open(fname + ".json") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write(self, fname, write):
+        """Write to a temporary file and rename it to fname"""
+        with NamedTemporaryFile("wb", dir=self.path, suffix=".tmp", delete=False) as f:
+            try:
+                write(f)
+            except Exception:
+                f.close()
+                os.remove(f.name)
+                raise
+        os.replace(f.name, fname)
+
+    def _save_meta(self, fname, meta):
+        self._write(fname + ".json", lambda f: f.write(json.dumps(meta).encode()))
+
+    def _fetch(self, client, bucket, key, version_id, meta) -> Optional[dict]:
+        """Get an object if it has changed, returning its metadata or None"""
+        from botocore.exceptions import ClientError
+
+        extra_args = {}
+        if version_id:
+            extra_args["VersionId"] = version_id
+        if meta:
+            extra_args["IfNoneMatch"] = meta["ETag"]
+        try:
+            response = client.get_object(bucket, key, extra_args=extra_args)
+        except ClientError as exc:
+            if exc.response["Error"]["Code"] not in ("304", "NotModified"):
+                raise
+            return None
+        fname = self._entry(bucket, key, version_id)
+        self._write(fname, lambda f: copyfileobj(response["Body"], f))
+        return {
+            "ETag": response["ETag"],
+            "ContentEncoding": response.get("ContentEncoding"),
+            "ContentLength": response["ContentLength"],
+        }
+
+    def open(self, client, bucket, key, version_id=None) -> Tuple[IO[bytes], dict]:
+        """
+        Open the cached copy of an object, fetching or revalidating it first.
+        Returns the open file and the object metadata (ETag, ContentEncoding and
+        ContentLength).
+
+        :param client: s3 object used to get the object
+        :param bucket: Bucket of the object
+        :param key: Key of the object
+        :param version_id: Version of the object, if not the latest
+        """
+        fname = self._entry(bucket, key, version_id)
+        meta = self._load(fname) if op.exists(fname) else None
+        fresh = meta is not None and (
+            version_id is not None or time.time() - meta["checked"] < self.ttl
+        )
+        added = 0
+        if not fresh:
+            logger.debug("Revalidating s3://%s/%s" % (bucket, key))
+            fetched = self._fetch(client, bucket, key, version_id, meta)
+            if fetched:
+                added = fetched["ContentLength"] - (
+                    meta["ContentLength"] if meta else 0
+                )
+                meta = fetched
+            meta["checked"] = time.time()
+            self._save_meta(fname, meta)
+        try:
+            f = open(fname, "rb")
+        except FileNotFoundError:
+            # evicted by another process in the meantime
+            meta = self._fetch(client, bucket, key, version_id, None)
+            meta["checked"] = time.time()
+            self._save_meta(fname, meta)
+            added = meta["ContentLength"]
+            f = open(fname, "rb")
+        # the modified time of an entry is the time it was last used
+        os.utime(fname)
+        if added:
+            self._added(added)
+        return f, meta
+
+    def _added(self, nbytes: int):
+        """Count bytes written to the cache, evicting if it is over max_bytes"""
+        with self._lock:
+            if self._size is not None:
+                self._size += nbytes
+            full = self._size is None or self._size > self.max_bytes
+        if full:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used objects until the cache fits in max_bytes"""
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith((".json", ".tmp")):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, fname in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for _fname in (fname, fname + ".json"):
+                try:
+                    os.remove(_fname)
+                except FileNotFoundError:
+                    pass
+            total -= size
+        with self._lock:
+            self._size = total
+
+    def clear(self):
+        """Remove all cached objects"""
+        for entry in os.scandir(self.path):
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._size = 0
@@ -0,0 +1,162 @@
+import bisect
+import logging
+import threading
+import time
+from copy import deepcopy
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# upper bounds (in milliseconds) of the latency histogram buckets
+LATENCY_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# error codes returned when a request is throttled
+THROTTLE_CODES = {
+    "SlowDown",
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "ProvisionedThroughputExceededException",
+    "BandwidthLimitExceeded",
+}
+
+# keys of the values kept in the botocore request context
+_START = "boto3utils_metrics_start"
+_BYTES_OUT = "boto3utils_metrics_bytes_out"
+
+
+def _operation(event_name):
+    # event names are "<event>.<service>.<operation>"
+    _, service, operation = event_name.split(".", 2)
+    return f"{service}.{operation}"
+
+
+class Metrics(object):
+    """
+    Per-operation request metrics collected from botocore client events
+
+    For each operation (e.g. "s3.GetObject") the number of calls and errors, a
+    latency histogram, the bytes sent and received (from Content-Length) and
+    the number of retries and throttled responses are recorded. Latency is the
+    time until the response headers arrive, so excludes reading a streamed body.
+
+    Clients only emit these events to handlers registered with attach(), so
+    there is no cost for clients without metrics.
+    """
+
+    def __init__(self, callback: Optional[Callable[[str, dict], None]] = None):
+        """
+        :param callback: Called with the operation name and a dict describing
+            each completed call (latency_ms, bytes_in, bytes_out, retries, error)
+        """
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._operations = {}
+
+    def attach(self, client):
+        """Record the requests made by a boto3 client"""
+        events = client.meta.events
+        events.register("before-call", self._before_call)
+        events.register("after-call", self._after_call)
+        events.register("after-call-error", self._after_call_error)
+        events.register("needs-retry", self._needs_retry)
+        return client
+
+    def _stats(self, operation) -> dict:
+        stats = self._operations.get(operation)
+        if stats is None:
+            stats = self._operations[operation] = {
+                "calls": 0,
+                "errors": 0,
+                "retries": 0,
+                "throttles": 0,
+                "bytes_in": 0,
+                "bytes_out": 0,
+                "latency_ms": {
+                    "sum": 0.0,
+                    "max": 0.0,
+                    "buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+                },
+            }
+        return stats
+
+    def _before_call(self, params, context, **kwargs):
+        from botocore.utils import determine_content_length
+
+        context[_START] = time.perf_counter()
+        context[_BYTES_OUT] = determine_content_length(params.get("body")) or 0
+
+    def _record(self, event_name, context, bytes_in=0, retries=0, error=None):
+        start = context.get(_START)
+        if start is None:
+            return
+        latency = 1000 * (time.perf_counter() - start)
+        operation = _operation(event_name)
+        record = {
+            "latency_ms": latency,
+            "bytes_in": bytes_in,
+            "bytes_out": context.get(_BYTES_OUT, 0),
+            "retries": retries,
+            "error": error,
+        }
+        with self._lock:
+            stats = self._stats(operation)
+            stats["calls"] += 1
+            stats["errors"] += error is not None
+            stats["retries"] += retries
+            stats["bytes_in"] += bytes_in
+            stats["bytes_out"] += record["bytes_out"]
+            histogram = stats["latency_ms"]
+            histogram["sum"] += latency
+            histogram["max"] = max(histogram["max"], latency)
+            histogram["buckets"][bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        if self.callback:
+            self.callback(operation, record)
+
+    def _after_call(self, http_response, parsed, context, event_name, **kwargs):
+        error = parsed.get("Error", {}).get("Code") if parsed else None
+        if error is None and http_response.status_code >= 300:
+            error = str(http_response.status_code)
+        self._record(
+            event_name,
+            context,
+            bytes_in=int(http_response.headers.get("Content-Length", 0) or 0),
+            retries=parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0),
+            error=error,
+        )
+
+    def _after_call_error(self, exception, context, event_name, **kwargs):
+        self._record(event_name, context, error=type(exception).__name__)
+
+    def _needs_retry(self, response, event_name, **kwargs):
+        if response is None:
+            return
+        code = response[1].get("Error", {}).get("Code")
+        status = response[0].status_code
+        if code in THROTTLE_CODES or status in (429, 503):
+            with self._lock:
+                self._stats(_operation(event_name))["throttles"] += 1
+
+    def snapshot(self) -> dict:
+        """
+        Get the metrics of every operation so far, as a dict keyed by operation.
+        Latency histogram buckets are keyed by their upper bound in ms.
+        """
+        with self._lock:
+            operations = deepcopy(self._operations)
+        for stats in operations.values():
+            histogram = stats["latency_ms"]
+            histogram["count"] = stats["calls"]
+            histogram["buckets"] = dict(
+                zip(LATENCY_BUCKETS + (float("inf"),), histogram["buckets"])
+            )
+        return operations
+
+    def reset(self):
+        """Forget all recorded metrics"""
+        with self._lock:
+            self._operations.clear()
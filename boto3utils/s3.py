@@ -1,63 +1,368 @@
-import boto3
 import json
+import codecs
+import gzip
 import hashlib
 import hmac
 import logging
 import os
 import os.path as op
-from typing import Tuple, Optional
-
-from botocore.exceptions import ClientError
+import queue
+import re
+import threading
+import weakref
+import zlib
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Tuple,
+    Optional,
+)
+
+from boto3utils.cache import S3Cache
+from boto3utils.metrics import Metrics
+from boto3utils.throttle import AdaptiveRateLimiter
+from collections.abc import Mapping
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from copy import deepcopy
 from datetime import datetime, timedelta
+from functools import lru_cache
 from gzip import GzipFile
 from io import BytesIO
 from os import makedirs, getenv
-from shutil import rmtree, copyfileobj
-from tempfile import mkdtemp
+from shutil import copyfileobj
 from urllib.parse import urlparse, parse_qs
 
+# boto3 and botocore are imported on first use, as they take a long time to import
+if TYPE_CHECKING:
+    import boto3
+
 logger = logging.getLogger(__name__)
 
+# number of simultaneous operations used by the bulk methods (download_many, ...)
+DEFAULT_MAX_WORKERS = 10
+
+MB = 1024**2
+GB = 1024**3
+
+# maximum number of keys in a DeleteObjects request
+DELETE_BATCH_SIZE = 1000
+
+# largest object a single CopyObject request can copy
+MAX_COPY_SIZE = 5 * GB
+
+# marks the end of the results put on a queue by a worker thread
+_DONE = object()
+
+
+def _map_concurrent(
+    fn: Callable, items: Iterable, max_workers: int = DEFAULT_MAX_WORKERS
+) -> Iterator[Tuple]:
+    """
+    Apply fn to every item in a thread pool, yielding (item, result, error) tuples
+    in the order they complete. Items are consumed lazily so that a generator
+    (e.g. from s3.find) is never held in memory in full.
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+
+        def submit(n):
+            for item in items:
+                pending[executor.submit(fn, item)] = item
+                n -= 1
+                if n == 0:
+                    break
+
+        # keep a bounded number of operations queued up ahead of the workers
+        submit(2 * max_workers)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                error = future.exception()
+                yield (item, None if error else future.result(), error)
+            submit(len(done))
+
+
+class _ByteBudget(object):
+    """Block callers until the total number of bytes they hold is under a limit"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes: int) -> int:
+        # an object larger than the whole budget is let through on its own
+        nbytes = min(nbytes, self.limit)
+        with self._cond:
+            while self.in_use + nbytes > self.limit:
+                self._cond.wait()
+            self.in_use += nbytes
+        return nbytes
+
+    def release(self, nbytes: int):
+        with self._cond:
+            self.in_use -= nbytes
+            self._cond.notify_all()
+
+
+# shared clients, keyed by (session, region, endpoint_url, max_pool_connections,
+# metrics, rate_limiter). Clients of the default session without metrics or a
+# rate limiter are kept for the life of the process; other clients only while
+# they are in use, so that a session per request does not keep a client (and
+# its credentials and connections) for every session.
+_clients = {}
+_session_clients = weakref.WeakValueDictionary()
+_clients_lock = threading.Lock()
+
+# bucket regions, keyed by (endpoint_url, bucket)
+_bucket_regions = {}
+
+
+def get_client(
+    session: "boto3.Session" = None,
+    region_name: Optional[str] = None,
+    endpoint_url: Optional[str] = None,
+    max_pool_connections: int = DEFAULT_MAX_WORKERS,
+    metrics: Optional[Metrics] = None,
+    rate_limiter: Optional[AdaptiveRateLimiter] = None,
+):
+    """
+    Get an S3 client from a process-wide registry, creating it on first use
+
+    Clients are thread safe, so one client (and its connection pool) is shared
+    by everything using the same session, region and endpoint. Changes made to a
+    shared client, such as registering event handlers, affect all of its users.
+    Clients of a session other than the default, or with metrics or a rate
+    limiter, are only kept in the registry while they are referenced.
+
+    :param session: boto3 Session, or None for the default session
+    :param region_name: Region of the client, or None for the session default
+    :param endpoint_url: URL of an S3 compatible service
+    :param max_pool_connections: Size of the client connection pool
+    :param metrics: Metrics recording the requests of the client. Clients with
+        metrics are only shared by users of the same Metrics object.
+    :param rate_limiter: Rate limiter applied to the requests of the client,
+        shared in the same way as metrics
+    """
+    key = (
+        session,
+        region_name,
+        endpoint_url,
+        max_pool_connections,
+        metrics,
+        rate_limiter,
+    )
+    if session is None and metrics is None and rate_limiter is None:
+        registry = _clients
+    else:
+        registry = _session_clients
+    client = registry.get(key)
+    if client is None:
+        with _clients_lock:
+            client = registry.get(key)
+            if client is None:
+                import boto3
+                from botocore.client import Config
+
+                config = Config(max_pool_connections=max_pool_connections)
+                client = (session or boto3).client(
+                    "s3",
+                    region_name=region_name,
+                    endpoint_url=endpoint_url,
+                    config=config,
+                )
+                if metrics is not None:
+                    metrics.attach(client)
+                if rate_limiter is not None:
+                    rate_limiter.attach(client)
+                registry[key] = client
+    return client
+
+
+def clear_clients():
+    """Empty the shared client registry and the bucket region cache"""
+    with _clients_lock:
+        _clients.clear()
+        _session_clients.clear()
+        _bucket_regions.clear()
+
+
+class S3URL(Mapping):
+    """
+    Immutable result of s3.urlparse, a mapping with the bucket, key, filename and
+    parameters of an S3 URL. Parameters are returned as a new dict on each access.
+    """
+
+    __slots__ = ("bucket", "key", "filename", "_parameters")
+
+    _fields = ("bucket", "key", "filename", "parameters")
+
+    def __init__(self, bucket: str, key: str, filename: str, parameters: dict):
+        object.__setattr__(self, "bucket", bucket)
+        object.__setattr__(self, "key", key)
+        object.__setattr__(self, "filename", filename)
+        object.__setattr__(self, "_parameters", parameters)
+
+    @property
+    def parameters(self) -> dict:
+        # repeated parameters are lists, copied too so the cached value is unchanged
+        return {
+            k: list(v) if isinstance(v, list) else v
+            for k, v in self._parameters.items()
+        }
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        # copy and pickle through __init__, as __setattr__ refuses
+        return (
+            type(self),
+            (self.bucket, self.key, self.filename, self._parameters),
+        )
+
+    def __getitem__(self, name):
+        if name not in self._fields:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __repr__(self):
+        return "%s(bucket=%r, key=%r, filename=%r, parameters=%r)" % (
+            type(self).__name__,
+            self.bucket,
+            self.key,
+            self.filename,
+            self._parameters,
+        )
+
+
+# characters that need the full (stdlib) URL parsing: query, fragment, IPv6
+# brackets and the whitespace that urllib strips
+_SLOW_URL_CHARS = re.compile(r"[?#\[\]\t\r\n]")
+
+
+@lru_cache(maxsize=4096)
+def _parse_url(url) -> S3URL:
+    if url.startswith("s3://") and url.isascii() and not _SLOW_URL_CHARS.search(url):
+        # plain s3://bucket/key URL
+        bucket, slash, key = url[5:].partition("/")
+        path = slash + key
+        return S3URL(bucket, key, os.path.basename(path), {})
+
+    _url = url
+
+    if url.startswith("https"):
+        _url = s3.https_to_s3(url)
+
+    if not url.startswith("s3://"):
+        raise Exception(f"Invalid S3 url {_url}")
+
+    parsed = urlparse(_url)
+    query_params = parse_qs(parsed.query or "")
+
+    # now fix the "list-of-1" to be a straight string
+    for key in query_params:
+        if len(query_params[key]) == 1:
+            query_params[key] = query_params[key][0]
+
+    return S3URL(
+        parsed.netloc,
+        parsed.path.removeprefix("/"),
+        os.path.basename(parsed.path),
+        query_params,
+    )
+
+
+class S3Object(NamedTuple):
+    """An object as returned by a bucket listing"""
+
+    url: str
+    size: int
+    etag: str
+    last_modified: datetime
+    storage_class: Optional[str]
+
 
 class s3(object):
     def __init__(
         self,
-        session: boto3.Session = None,
+        session: "boto3.Session" = None,
         requester_pays: bool = False,
         endpoint_url: Optional[str] = None,
+        max_pool_connections: int = DEFAULT_MAX_WORKERS,
+        per_region_clients: bool = False,
+        cache: Optional[S3Cache] = None,
+        metrics: Optional[Metrics] = None,
+        rate_limiter: Optional[AdaptiveRateLimiter] = None,
     ):
+        """
+        S3 URL based interface to a boto3 client
+
+        Clients are shared between all s3 objects created with the same session,
+        endpoint_url and max_pool_connections (see get_client).
+
+        :param session: boto3 Session used to create the client
+        :param requester_pays: Make requests to requester pays buckets
+        :param endpoint_url: URL of an S3 compatible service
+        :param max_pool_connections: Size of the client connection pool, which
+            should be at least the number of workers used in the bulk methods
+        :param per_region_clients: Send requests for each bucket with a client
+            for the region of the bucket, rather than relying on redirects
+        :param cache: Local cache used by read(), read_json() and download()
+        :param metrics: Metrics recording the requests made
+        :param rate_limiter: Adaptive rate limiting of requests per bucket or
+            prefix, which can be shared with other s3 objects
+        """
         self.requester_pays = requester_pays
-        if session is None:
-            self.s3 = boto3.client("s3", endpoint_url=endpoint_url)
-        else:
-            self.s3 = session.client("s3", endpoint_url=endpoint_url)
+        self.session = session
+        self.endpoint_url = endpoint_url
+        self.max_pool_connections = max_pool_connections
+        self.per_region_clients = per_region_clients
+        self.cache = cache
+        self.metrics = metrics
+        self.rate_limiter = rate_limiter
+        # clients for the regions of buckets, when per_region_clients is set
+        self._region_clients = {}
+        self.s3 = get_client(
+            session=session,
+            endpoint_url=endpoint_url,
+            max_pool_connections=max_pool_connections,
+            metrics=metrics,
+            rate_limiter=rate_limiter,
+        )
+
+    def _client(self, bucket):
+        """Get the client to use for requests to a bucket"""
+        if not self.per_region_clients:
+            return self.s3
+        region = self.get_bucket_region(bucket)
+        client = self._region_clients.get(region)
+        if client is None:
+            client = self._region_clients[region] = get_client(
+                session=self.session,
+                region_name=region,
+                endpoint_url=self.endpoint_url,
+                max_pool_connections=self.max_pool_connections,
+                metrics=self.metrics,
+                rate_limiter=self.rate_limiter,
+            )
+        return client
 
     @classmethod
-    def urlparse(cls, url):
+    def urlparse(cls, url) -> S3URL:
         """Split S3 URL into bucket, key, filename, query_params"""
-        _url = deepcopy(url)
-
-        if url.startswith("https"):
-            _url = cls.https_to_s3(url)
-
-        if not url.startswith("s3://"):
-            raise Exception(f"Invalid S3 url {_url}")
-
-        parsed = urlparse(_url)
-        query_params = parse_qs(parsed.query or "")
-
-        # now fix the "list-of-1" to be a straight string
-        for key in query_params:
-            if len(query_params[key]) == 1:
-                query_params[key] = query_params[key][0]
-
-        return {
-            "bucket": parsed.netloc,
-            "key": parsed.path.removeprefix("/"),
-            "filename": os.path.basename(parsed.path),
-            "parameters": query_params,
-        }
+        return _parse_url(url)
 
     @classmethod
     def https_to_s3(cls, url):
@@ -81,13 +386,17 @@ class s3(object):
 
     def exists(self, url):
         """Check if this URL exists on S3"""
+        from botocore.exceptions import ClientError
+
         parts = self.urlparse(url)
         try:
             kwargs = {}
             if self.requester_pays:
                 kwargs["RequestPayer"] = "requester"
 
-            self.s3.head_object(Bucket=parts["bucket"], Key=parts["key"], **kwargs)
+            self._client(parts["bucket"]).head_object(
+                Bucket=parts["bucket"], Key=parts["key"], **kwargs
+            )
             return True
         except ClientError as exc:
             if exc.response["Error"]["Code"] != "404":
@@ -95,39 +404,153 @@ class s3(object):
             return False
 
     def get_bucket_region(self, bucket_name):
-        region = self.s3.get_bucket_location(Bucket=bucket_name)["LocationConstraint"]
-        # US Standard region buckets will have a null location
-        # https://github.com/aws/aws-cli/issues/3864
-        return region if region else "us-east-1"
+        """Get the region of a bucket, looked up once per process"""
+        cache_key = (self.endpoint_url, bucket_name)
+        region = _bucket_regions.get(cache_key)
+        if region is None:
+            region = self.s3.get_bucket_location(Bucket=bucket_name)[
+                "LocationConstraint"
+            ]
+            # US Standard region buckets will have a null location
+            # https://github.com/aws/aws-cli/issues/3864
+            region = region if region else "us-east-1"
+            _bucket_regions[cache_key] = region
+        return region
 
     def upload(self, filename, url, public=False, extra={}, http_url=False):
         """Upload object to S3 uri (bucket + prefix), keeping same base filename"""
+        return self._upload(
+            filename, url, public=public, extra=extra, http_url=http_url
+        )
+
+    def _upload(
+        self,
+        filename,
+        url,
+        public=False,
+        extra={},
+        http_url=False,
+        config=None,
+        region=None,
+    ):
         logger.debug("Uploading %s to %s" % (filename, url))
         parts = self.urlparse(url)
-        url_out = "s3://%s" % op.join(parts["bucket"], parts["key"])
         if public:
             extra["ACL"] = "public-read"
         with open(filename, "rb") as data:
-            self.s3.upload_fileobj(data, parts["bucket"], parts["key"], ExtraArgs=extra)
+            self._client(parts["bucket"]).upload_fileobj(
+                data, parts["bucket"], parts["key"], ExtraArgs=extra, Config=config
+            )
+        return self._uploaded_url(parts, http_url=http_url, region=region)
+
+    def _uploaded_url(self, parts, http_url=False, region=None):
+        url_out = "s3://%s" % op.join(parts["bucket"], parts["key"])
         if http_url:
-            return self.s3_to_https(url_out, self.get_bucket_region(parts["bucket"]))
+            region = region or self.get_bucket_region(parts["bucket"])
+            return self.s3_to_https(url_out, region)
         else:
             return url_out
 
-    def upload_json(self, data, url, extra={}, **kwargs):
-        """Upload dictionary as JSON to URL"""
-        tmpdir = mkdtemp()
-        filename = op.join(tmpdir, "catalog.json")
+    def upload_many(
+        self,
+        files: Iterable[Tuple[str, str]],
+        public=False,
+        extra={},
+        http_url=False,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        multipart_threshold: int = 8 * MB,
+        multipart_chunksize: int = 8 * MB,
+        max_concurrency: int = 1,
+    ) -> Iterator[Tuple[Tuple[str, str], Optional[str], Optional[Exception]]]:
+        """
+        Upload many files concurrently, sharing this client and its connection pool
+
+        Results are generated as each upload finishes, as ((filename, url), url_out,
+        error) tuples. A failed upload does not stop the batch: its url_out is None
+        and error holds the exception.
+
+        :param files: (filename, url) pairs to upload, any iterable
+        :param public: Make the uploaded objects public-read
+        :param extra: Extra arguments passed to the s3 client.
+        :param http_url: Return https URLs rather than s3 URLs. The region of
+            each bucket is looked up once per batch.
+        :param max_workers: Number of simultaneous file uploads
+        :param multipart_threshold: Size above which multipart uploads are used
+        :param multipart_chunksize: Size of each part in a multipart upload
+        :param max_concurrency: Number of threads uploading the parts of a
+            single multipart file
+        """
+        from boto3.s3.transfer import TransferConfig
+
+        config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=max_concurrency > 1,
+        )
+        regions = {}
+        regions_lock = threading.Lock()
+
+        def _upload(item):
+            filename, url = item
+            region = None
+            if http_url:
+                bucket = self.urlparse(url)["bucket"]
+                with regions_lock:
+                    if bucket not in regions:
+                        regions[bucket] = self.get_bucket_region(bucket)
+                    region = regions[bucket]
+            return self._upload(
+                filename,
+                url,
+                public=public,
+                extra=deepcopy(extra),
+                http_url=http_url,
+                config=config,
+                region=region,
+            )
+
+        yield from _map_concurrent(_upload, files, max_workers=max_workers)
+
+    def upload_json(
+        self,
+        data,
+        url,
+        extra={},
+        public=False,
+        http_url=False,
+        compress=False,
+        dumps: Callable = json.dumps,
+    ):
+        """
+        Upload dictionary as JSON to URL
+
+        The document is serialized and uploaded from memory in a single request.
+
+        :param data: JSON serializable data
+        :param url: URL of the object to write
+        :param extra: Extra arguments passed to the s3 client.
+        :param compress: gzip the document and set `ContentEncoding: gzip`
+        :param dumps: JSON encoder returning str or bytes (e.g. orjson.dumps)
+        """
+        parts = self.urlparse(url)
         _extra = {"ContentType": "application/json"}
         _extra.update(extra)
-        with open(filename, "w") as f:
-            f.write(json.dumps(data))
+        if public:
+            _extra["ACL"] = "public-read"
         try:
-            self.upload(filename, url, extra=_extra, **kwargs)
+            body = dumps(data)
+            if isinstance(body, str):
+                body = body.encode("utf-8")
+            if compress:
+                body = gzip.compress(body)
+                _extra["ContentEncoding"] = "gzip"
+            self._client(parts["bucket"]).put_object(
+                Bucket=parts["bucket"], Key=parts["key"], Body=body, **_extra
+            )
+            return self._uploaded_url(parts, http_url=http_url)
         except Exception as err:
             logger.error(err)
-        finally:
-            rmtree(tmpdir)
 
     def get_object(self, bucket, key, extra_args={}):
         """Get an S3 object"""
@@ -136,7 +559,7 @@ class s3(object):
         if self.requester_pays:
             extra_args["RequestPayer"] = "requester"
 
-        return self.s3.get_object(Bucket=bucket, Key=key, **extra_args)
+        return self._client(bucket).get_object(Bucket=bucket, Key=key, **extra_args)
 
     def get_object_metadata(self, uri, **kwargs):
         """
@@ -156,7 +579,7 @@ class s3(object):
         if self.requester_pays:
             extra_args["RequestPayer"] = "requester"
 
-        response = self.s3.get_object_attributes(
+        response = self._client(s3_uri["bucket"]).get_object_attributes(
             Bucket=s3_uri["bucket"],
             Key=s3_uri["key"],
             ObjectAttributes=["ETag", "Checksum", "ObjectSize", "ObjectParts"],
@@ -191,7 +614,15 @@ class s3(object):
             for key in s3_uri["parameters"]:
                 extra_args[key] = s3_uri["parameters"][key]
 
-        self.s3.download_file(
+        if self.cache and set(extra_args) <= {"RequestPayer", "VersionId"}:
+            f, _ = self.cache.open(
+                self, s3_uri["bucket"], s3_uri["key"], extra_args.get("VersionId")
+            )
+            with f, open(fout, "wb") as fdst:
+                copyfileobj(f, fdst)
+            return fout
+
+        self._client(s3_uri["bucket"]).download_file(
             s3_uri["bucket"], s3_uri["key"], fout, ExtraArgs=extra_args
         )
         return fout
@@ -244,15 +675,388 @@ class s3(object):
 
         return (fout, meta)
 
+    def download_many(
+        self,
+        urls: Iterable[str],
+        path="",
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        max_bytes_in_flight: Optional[int] = None,
+        extra_args={},
+    ) -> Iterator[Tuple[str, Optional[str], Optional[Exception]]]:
+        """
+        Download many objects concurrently, sharing this client and its connection pool
+
+        Results are generated as each download finishes, as (url, filename, error)
+        tuples. A failed download does not stop the batch: its filename is None and
+        error holds the exception.
+
+        :param urls: URLs of objects to download, any iterable (e.g. from find())
+        :param path: Output path
+        :param max_workers: Number of simultaneous downloads
+        :param max_bytes_in_flight: Limit on the total size of objects being
+            downloaded at once
+        :param extra_args: Extra arguments passed to the s3 client.
+        """
+        if path != "":
+            makedirs(path, exist_ok=True)
+        budget = _ByteBudget(max_bytes_in_flight) if max_bytes_in_flight else None
+
+        def _download(url):
+            fout = op.join(path, self.urlparse(url)["filename"])
+            return self._download_to(url, fout, extra_args=extra_args, budget=budget)
+
+        yield from _map_concurrent(_download, urls, max_workers=max_workers)
+
+    def _download_to(self, url, fout, extra_args={}, budget=None):
+        """Stream an object into a local file, removing partial files on error"""
+        parts = self.urlparse(url)
+        extra_args = deepcopy(extra_args or {})
+        extra_args.update(parts["parameters"])
+
+        result = self.get_object(parts["bucket"], parts["key"], extra_args=extra_args)
+        nbytes = budget.acquire(result["ContentLength"]) if budget else 0
+        try:
+            with open(fout, "wb") as f:
+                copyfileobj(result["Body"], f)
+        except Exception:
+            if op.exists(fout):
+                os.remove(fout)
+            raise
+        finally:
+            result["Body"].close()
+            if budget:
+                budget.release(nbytes)
+        return fout
+
+    def copy(
+        self,
+        src,
+        dst,
+        extra={},
+        multipart_threshold: int = 5 * GB,
+        part_size: int = 256 * MB,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> str:
+        """
+        Copy an object within S3, without downloading it
+
+        Objects larger than multipart_threshold (at most 5 GB, the limit of a
+        single CopyObject request) are copied as parts, several at a time. With
+        the default threshold the object is copied with CopyObject straight
+        away, and its size is only looked up if S3 refuses it as too large.
+
+        :param src: URL of the object to copy
+        :param dst: URL of the new object
+        :param extra: Extra arguments passed to the s3 client.
+        :param multipart_threshold: Size above which parts are copied
+        :param part_size: Size of each part copied
+        :param max_workers: Number of parts copied simultaneously
+        """
+        return self._copy(
+            src,
+            dst,
+            extra=extra,
+            multipart_threshold=multipart_threshold,
+            part_size=part_size,
+            max_workers=max_workers,
+        )
+
+    def _copy(
+        self,
+        src,
+        dst,
+        size=None,
+        extra={},
+        multipart_threshold: int = 5 * GB,
+        part_size: int = 256 * MB,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ):
+        logger.debug("Copying %s to %s" % (src, dst))
+        src_parts = self.urlparse(src)
+        dst_parts = self.urlparse(dst)
+        source = {"Bucket": src_parts["bucket"], "Key": src_parts["key"]}
+        if "VersionId" in src_parts["parameters"]:
+            source["VersionId"] = src_parts["parameters"]["VersionId"]
+        kwargs = {}
+        if self.requester_pays:
+            kwargs["RequestPayer"] = "requester"
+        client = self._client(dst_parts["bucket"])
+        target = {"Bucket": dst_parts["bucket"], "Key": dst_parts["key"], **kwargs}
+
+        if size is None and multipart_threshold >= MAX_COPY_SIZE:
+            # any object CopyObject can copy is copied in one request, without
+            # getting its size first; larger objects are refused
+            from botocore.exceptions import ClientError
+
+            try:
+                client.copy_object(CopySource=source, **target, **extra)
+                return dst
+            except ClientError as exc:
+                if exc.response["Error"]["Code"] != "InvalidRequest":
+                    raise
+                head = self._client(src_parts["bucket"]).head_object(**source, **kwargs)
+                size = head["ContentLength"]
+                if size <= multipart_threshold:
+                    raise
+        else:
+            head = None
+            if size is None or size > multipart_threshold:
+                head = self._client(src_parts["bucket"]).head_object(**source, **kwargs)
+                size = head["ContentLength"]
+            if size <= multipart_threshold:
+                client.copy_object(CopySource=source, **target, **extra)
+                return dst
+
+        # CopyObject does not work above 5 GB: copy the object as parts, keeping
+        # the content type and metadata as CopyObject would have. CopyObject
+        # arguments go to whichever of the two calls accepts them: source
+        # conditions and encryption keys apply to every part
+        model = client.meta.service_model
+        create_members = model.operation_model(
+            "CreateMultipartUpload"
+        ).input_shape.members
+        part_members = model.operation_model("UploadPartCopy").input_shape.members
+        create_args = {}
+        if extra.get("MetadataDirective") != "REPLACE":
+            create_args = {
+                "ContentType": head["ContentType"],
+                "Metadata": head["Metadata"],
+            }
+        create_args.update({k: v for k, v in extra.items() if k in create_members})
+        part_args = {
+            k: v
+            for k, v in extra.items()
+            if k in part_members and k.startswith(("CopySource", "SSECustomer"))
+        }
+        upload_id = client.create_multipart_upload(**target, **create_args)["UploadId"]
+        # a multipart upload can have at most 10000 parts
+        part_size = max(part_size, -(-size // 10000))
+
+        def _copy_part(number):
+            start = (number - 1) * part_size
+            end = min(start + part_size, size) - 1
+            response = client.upload_part_copy(
+                CopySource=source,
+                CopySourceRange="bytes=%s-%s" % (start, end),
+                PartNumber=number,
+                UploadId=upload_id,
+                **target,
+                **part_args,
+            )
+            return response["CopyPartResult"]["ETag"]
+
+        numbers = range(1, -(-size // part_size) + 1)
+        try:
+            etags = {}
+            for number, etag, error in _map_concurrent(
+                _copy_part, numbers, max_workers=max_workers
+            ):
+                if error:
+                    raise error
+                etags[number] = etag
+            client.complete_multipart_upload(
+                MultipartUpload={
+                    "Parts": [{"ETag": etags[n], "PartNumber": n} for n in numbers]
+                },
+                UploadId=upload_id,
+                **target,
+            )
+        except Exception:
+            client.abort_multipart_upload(UploadId=upload_id, **target)
+            raise
+        return dst
+
+    def copy_many(
+        self,
+        pairs: Iterable[Tuple[str, str]],
+        extra={},
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        **kwargs,
+    ) -> Iterator[Tuple[Tuple[str, str], Optional[str], Optional[Exception]]]:
+        """
+        Copy many objects within S3 concurrently
+
+        Results are generated as each copy finishes, as ((src, dst), dst, error)
+        tuples. A failed copy does not stop the batch: its dst is None and error
+        holds the exception.
+
+        :param pairs: (src, dst) URL pairs, any iterable
+        :param extra: Extra arguments passed to the s3 client.
+        :param max_workers: Number of simultaneous copies
+        :param kwargs: multipart_threshold and part_size, as for copy()
+        """
+
+        def _copy(pair):
+            return self._copy(*pair, extra=extra, **kwargs)
+
+        yield from _map_concurrent(_copy, pairs, max_workers=max_workers)
+
+    def copy_prefix(
+        self,
+        src,
+        dst,
+        suffix="",
+        extra={},
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        **kwargs,
+    ) -> Iterator[Tuple[Tuple[str, str], Optional[str], Optional[Exception]]]:
+        """
+        Copy all objects below a URL to another URL, as they are listed
+
+        Each object is copied to dst followed by the rest of its URL after src.
+        Results are generated as for copy_many().
+
+        :param src: The beginning part of the URLs to copy (bucket + optional prefix)
+        :param dst: The beginning part of the new URLs
+        :param suffix: Only copy objects whose keys end with this suffix.
+        :param extra: Extra arguments passed to the s3 client.
+        :param max_workers: Number of simultaneous copies
+        :param kwargs: multipart_threshold and part_size, as for copy()
+        """
+
+        def _copy(obj):
+            dst_url = dst + obj.url[len(src) :]
+            return self._copy(obj.url, dst_url, size=obj.size, extra=extra, **kwargs)
+
+        for obj, dst_url, error in _map_concurrent(
+            _copy, self.find_objects(src, suffix=suffix), max_workers=max_workers
+        ):
+            yield ((obj.url, dst + obj.url[len(src) :]), dst_url, error)
+
+    def read_range(self, url, start: int, end: Optional[int] = None) -> bytes:
+        """
+        Read a range of bytes from an object
+
+        :param url: URL of the object to read
+        :param start: Offset of the first byte
+        :param end: Offset of the last byte (inclusive, as in an HTTP Range
+            header), or None to read to the end of the object
+        """
+        parts = self.urlparse(url)
+        extra_args = dict(parts["parameters"])
+        extra_args["Range"] = "bytes=%s-%s" % (start, "" if end is None else end)
+        response = self.get_object(parts["bucket"], parts["key"], extra_args=extra_args)
+        return response["Body"].read()
+
+    def _read_ranges(self, url, allocate, write, part_size, max_workers):
+        """
+        Fetch an object as concurrent byte ranges, passing the total size to
+        allocate and then each (offset, data) part to write, in any order
+        """
+        parts = self.urlparse(url)
+        extra_args = dict(parts["parameters"])
+        if self.requester_pays:
+            extra_args["RequestPayer"] = "requester"
+        head = self._client(parts["bucket"]).head_object(
+            Bucket=parts["bucket"], Key=parts["key"], **extra_args
+        )
+        size, etag = head["ContentLength"], head["ETag"]
+        allocate(size)
+
+        def _get(start):
+            end = min(start + part_size, size) - 1
+            _extra_args = dict(extra_args)
+            # fail rather than mix ranges of different versions of the object
+            _extra_args["IfMatch"] = etag
+            _extra_args["Range"] = "bytes=%s-%s" % (start, end)
+            response = self.get_object(
+                parts["bucket"], parts["key"], extra_args=_extra_args
+            )
+            if response["ETag"] != etag:
+                raise Exception(f"{url} changed while being read")
+            write(start, response["Body"].read())
+
+        ranges = range(0, size, part_size)
+        for _, _, error in _map_concurrent(_get, ranges, max_workers=max_workers):
+            if error:
+                raise error
+
+    def read_parallel(
+        self,
+        url,
+        part_size: int = 8 * MB,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> bytearray:
+        """
+        Read a large object into memory, fetching byte ranges concurrently
+
+        :param url: URL of the object to read
+        :param part_size: Size of each range
+        :param max_workers: Number of simultaneous range requests
+        """
+        buffer = bytearray()
+
+        def allocate(size):
+            buffer.extend(bytes(size))
+
+        def write(offset, data):
+            buffer[offset : offset + len(data)] = data
+
+        self._read_ranges(url, allocate, write, part_size, max_workers)
+        return buffer
+
+    def download_parallel(
+        self,
+        uri,
+        path="",
+        part_size: int = 8 * MB,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> str:
+        """
+        Download a large object from S3, fetching byte ranges concurrently into a
+        preallocated file. The ETag of every range must match, so an object
+        overwritten during the download raises an error instead of being mixed.
+
+        :param uri: URI of object to download
+        :param path: Output path
+        :param part_size: Size of each range
+        :param max_workers: Number of simultaneous range requests
+        """
+        s3_uri = self.urlparse(uri)
+        fout = op.join(path, s3_uri["filename"])
+        logger.debug("Downloading %s as %s" % (uri, fout))
+
+        if path != "":
+            makedirs(path, exist_ok=True)
+
+        lock = threading.Lock()
+        with open(fout, "wb") as f:
+
+            def write(offset, data):
+                with lock:
+                    f.seek(offset)
+                    f.write(data)
+
+            try:
+                self._read_ranges(uri, f.truncate, write, part_size, max_workers)
+            except Exception:
+                f.close()
+                os.remove(fout)
+                raise
+        return fout
+
     def read(self, url):
         """Read object from s3"""
         parts = self.urlparse(url)
         kwargs = {}
         if self.requester_pays:
             kwargs["RequestPayer"] = "requester"
-        response = self.get_object(parts["bucket"], parts["key"], extra_args=kwargs)
-        body = response["Body"].read()
-        if op.splitext(parts["key"])[1] == ".gz":
+        if self.cache:
+            f, response = self.cache.open(
+                self,
+                parts["bucket"],
+                parts["key"],
+                parts["parameters"].get("VersionId"),
+            )
+            with f:
+                body = f.read()
+        else:
+            response = self.get_object(parts["bucket"], parts["key"], extra_args=kwargs)
+            body = response["Body"].read()
+        if (
+            op.splitext(parts["key"])[1] == ".gz"
+            or response.get("ContentEncoding") == "gzip"
+        ):
             body = GzipFile(None, "rb", fileobj=BytesIO(body)).read()
         return body.decode("utf-8")
 
@@ -260,34 +1064,177 @@ class s3(object):
         """Download object from S3 as JSON"""
         return json.loads(self.read(url))
 
+    def _read_bytes(self, url, chunk_size: int = MB) -> Iterator[bytes]:
+        """Generate the (decompressed) bytes of an object as they arrive"""
+        parts = self.urlparse(url)
+        response = self.get_object(parts["bucket"], parts["key"])
+        decompressor = None
+        if (
+            op.splitext(parts["key"])[1] == ".gz"
+            or response.get("ContentEncoding") == "gzip"
+        ):
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            for chunk in response["Body"].iter_chunks(chunk_size):
+                if decompressor:
+                    data = decompressor.decompress(chunk)
+                    # gzip files may be made of several concatenated members
+                    while decompressor.eof and decompressor.unused_data:
+                        unused = decompressor.unused_data
+                        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                        data += decompressor.decompress(unused)
+                    chunk = data
+                if chunk:
+                    yield chunk
+        finally:
+            response["Body"].close()
+
+    def read_stream(self, url, chunk_size: int = MB) -> Iterator[str]:
+        """
+        Read object from s3 as a stream of text chunks
+
+        Gzipped objects are decompressed, and the text decoded, incrementally so
+        memory use does not depend on the size of the object.
+
+        :param url: URL of the object to read
+        :param chunk_size: Number of bytes read from the response at a time
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for chunk in self._read_bytes(url, chunk_size=chunk_size):
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+
+    def iter_lines(self, url, chunk_size: int = MB) -> Iterator[str]:
+        """Read object from s3 line by line, without the line endings (\\n or \\r\\n)"""
+        pending = ""
+        for chunk in self.read_stream(url, chunk_size=chunk_size):
+            lines = (pending + chunk).split("\n")
+            pending = lines.pop()
+            for line in lines:
+                yield line[:-1] if line.endswith("\r") else line
+        if pending:
+            yield pending[:-1] if pending.endswith("\r") else pending
+
+    def read_json_lines(self, url, chunk_size: int = MB) -> Iterator:
+        """Read newline delimited JSON (NDJSON) from s3, one document at a time"""
+        for line in self.iter_lines(url, chunk_size=chunk_size):
+            if line.strip():
+                yield json.loads(line)
+
     def delete(self, url):
         """Remove object from S3"""
         parts = self.urlparse(url)
-        response = self.s3.delete_object(Bucket=parts["bucket"], Key=parts["key"])
+        response = self._client(parts["bucket"]).delete_object(
+            Bucket=parts["bucket"], Key=parts["key"]
+        )
         return response
 
-    # function derived from https://alexwlchan.net/2018/01/listing-s3-keys-redux/
-    def find(self, url, suffix=""):
+    def delete_many(
+        self, urls: Iterable[str], max_workers: int = DEFAULT_MAX_WORKERS
+    ) -> list:
         """
-        Generate objects in an S3 bucket.
-        :param url: The beginning part of the URL to match (bucket + optional prefix)
-        :param suffix: Only fetch objects whose keys end with this suffix.
+        Remove many objects from S3, using DeleteObjects requests of up to 1000 keys
+        run concurrently. URLs are consumed lazily, so can come from find().
+
+        Returns the objects that could not be deleted, as a list of dicts with
+        the url, the error code and the error message.
+
+        :param urls: URLs of objects to delete, any iterable
+        :param max_workers: Number of simultaneous DeleteObjects requests
         """
-        parts = self.urlparse(url)
-        kwargs = {"Bucket": parts["bucket"]}
 
-        # If the prefix is a single string (not a tuple of strings), we can
-        # do the filtering directly in the S3 API.
-        if isinstance(parts["key"], str):
-            kwargs["Prefix"] = parts["key"]
+        def _batches():
+            batches = {}
+            for url in urls:
+                parts = self.urlparse(url)
+                obj = {"Key": parts["key"]}
+                if "VersionId" in parts["parameters"]:
+                    obj["VersionId"] = parts["parameters"]["VersionId"]
+                batch = batches.setdefault(parts["bucket"], [])
+                batch.append(obj)
+                if len(batch) == DELETE_BATCH_SIZE:
+                    yield (parts["bucket"], batches.pop(parts["bucket"]))
+            yield from batches.items()
+
+        def _delete(batch):
+            bucket, objects = batch
+            kwargs = {}
+            if self.requester_pays:
+                kwargs["RequestPayer"] = "requester"
+            response = self._client(bucket).delete_objects(
+                Bucket=bucket, Delete={"Objects": objects, "Quiet": True}, **kwargs
+            )
+            return response.get("Errors", [])
+
+        errors = []
+        for (bucket, objects), results, error in _map_concurrent(
+            _delete, _batches(), max_workers=max_workers
+        ):
+            if error:
+                # the whole request failed, so every key in it did too
+                code = getattr(error, "response", {}).get("Error", {}).get("Code")
+                results = [
+                    dict(obj, Code=code or type(error).__name__, Message=str(error))
+                    for obj in objects
+                ]
+            for result in results:
+                errors.append(
+                    {
+                        "url": f"s3://{bucket}/{result['Key']}",
+                        "code": result.get("Code"),
+                        "message": result.get("Message"),
+                    }
+                )
+        return errors
+
+    def delete_prefix(
+        self, url, suffix="", max_workers: int = DEFAULT_MAX_WORKERS
+    ) -> list:
+        """
+        Remove all objects below a URL, listing and deleting them in batches
+
+        Returns the objects that could not be deleted, as with delete_many().
 
+        :param url: The beginning part of the URL to match (bucket + optional prefix)
+        :param suffix: Only delete objects whose keys end with this suffix.
+        :param max_workers: Number of simultaneous DeleteObjects requests
+        """
+        return self.delete_many(self.find(url, suffix=suffix), max_workers=max_workers)
+
+    def _list_pages(self, bucket, prefix="", **kwargs):
+        """Generate the responses of a paginated list_objects_v2 call"""
+        kwargs.update({"Bucket": bucket, "Prefix": prefix})
         if self.requester_pays:
             kwargs["RequestPayer"] = "requester"
 
         while True:
             # The S3 API response is a large blob of metadata.
             # 'Contents' contains information about the listed objects.
-            resp = self.s3.list_objects_v2(**kwargs)
+            resp = self._client(bucket).list_objects_v2(**kwargs)
+            yield resp
+
+            # The S3 API is paginated, returning up to 1000 keys at a time.
+            # Pass the continuation token into the next response, until we
+            # reach the final page (when this field is missing).
+            try:
+                kwargs["ContinuationToken"] = resp["NextContinuationToken"]
+            except KeyError:
+                break
+
+    # function derived from https://alexwlchan.net/2018/01/listing-s3-keys-redux/
+    def find(self, url, suffix=""):
+        """
+        Generate objects in an S3 bucket.
+        :param url: The beginning part of the URL to match (bucket + optional prefix)
+        :param suffix: Only fetch objects whose keys end with this suffix.
+        """
+        parts = self.urlparse(url)
+
+        for resp in self._list_pages(parts["bucket"], parts["key"]):
             try:
                 contents = resp["Contents"]
             except KeyError:
@@ -298,13 +1245,267 @@ class s3(object):
                 if key.startswith(parts["key"]) and key.endswith(suffix):
                     yield f"s3://{parts['bucket']}/{obj['Key']}"
 
-            # The S3 API is paginated, returning up to 1000 keys at a time.
-            # Pass the continuation token into the next response, until we
-            # reach the final page (when this field is missing).
+    def find_objects(self, url, suffix="", start_after=None) -> Iterator[S3Object]:
+        """
+        Generate objects in an S3 bucket with the metadata returned by the listing.
+
+        The url of any record is also a resume token: pass the url of the last
+        record processed as start_after to continue an interrupted listing.
+
+        :param url: The beginning part of the URL to match (bucket + optional prefix)
+        :param suffix: Only fetch objects whose keys end with this suffix.
+        :param start_after: Only fetch objects after this URL
+        """
+        parts = self.urlparse(url)
+        bucket = parts["bucket"]
+        kwargs = {}
+        if start_after:
+            kwargs["StartAfter"] = self.urlparse(start_after)["key"]
+
+        for resp in self._list_pages(bucket, parts["key"], **kwargs):
+            for obj in resp.get("Contents", []):
+                key = obj["Key"]
+                if key.startswith(parts["key"]) and key.endswith(suffix):
+                    yield S3Object(
+                        f"s3://{bucket}/{key}",
+                        obj["Size"],
+                        obj["ETag"],
+                        obj["LastModified"],
+                        obj.get("StorageClass"),
+                    )
+
+    def find_parallel(
+        self,
+        url,
+        suffix="",
+        prefixes: Optional[Iterable[str]] = None,
+        delimiter="/",
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        ordered=False,
+        max_pages_buffered: int = 2,
+    ):
+        """
+        Generate objects in an S3 bucket, listing several prefixes concurrently.
+
+        The listing is split on the common prefixes found one level below url
+        (using delimiter), or on the prefixes given by the caller, and each
+        prefix is listed by its own worker.
+
+        :param url: The beginning part of the URL to match (bucket + optional prefix)
+        :param suffix: Only fetch objects whose keys end with this suffix.
+        :param prefixes: Key prefixes to list in parallel, instead of the common
+            prefixes below url. They must not overlap.
+        :param delimiter: Delimiter used to find the common prefixes
+        :param max_workers: Number of prefixes listed simultaneously
+        :param ordered: Generate URLs in the same order as find() does, rather
+            than as soon as each page is listed
+        :param max_pages_buffered: Number of listed pages each worker holds
+            before waiting for them to be consumed, bounding memory use
+        """
+        parts = self.urlparse(url)
+        bucket = parts["bucket"]
+
+        def _url(key):
+            return f"s3://{bucket}/{key}"
+
+        # shards are (sort key, prefix or None) - None for keys listed directly
+        shards = []
+        if prefixes is None:
+            for resp in self._list_pages(bucket, parts["key"], Delimiter=delimiter):
+                for obj in resp.get("Contents", []):
+                    if obj["Key"].endswith(suffix):
+                        shards.append((obj["Key"], None))
+                for common in resp.get("CommonPrefixes", []):
+                    shards.append((common["Prefix"], common["Prefix"]))
+        else:
+            shards = [(prefix, prefix) for prefix in prefixes]
+        if ordered:
+            shards.sort()
+
+        stop = threading.Event()
+
+        def _put(q, item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def _list(prefix, q):
+            # shards still queued when the generator is closed are not listed
+            if stop.is_set():
+                return
             try:
-                kwargs["ContinuationToken"] = resp["NextContinuationToken"]
-            except KeyError:
-                break
+                for resp in self._list_pages(bucket, prefix):
+                    urls = [
+                        _url(obj["Key"])
+                        for obj in resp.get("Contents", [])
+                        if obj["Key"].startswith(parts["key"])
+                        and obj["Key"].endswith(suffix)
+                    ]
+                    if (urls and not _put(q, urls)) or stop.is_set():
+                        return
+            except Exception as err:
+                _put(q, err)
+            else:
+                _put(q, _DONE)
+
+        def _get(q):
+            item = q.get()
+            if isinstance(item, Exception):
+                raise item
+            return item
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            try:
+                if ordered:
+                    # a queue per prefix, consumed in turn; prefixes are
+                    # submitted in order so the one being consumed is running
+                    queues = {}
+                    for key, prefix in shards:
+                        if prefix is not None:
+                            queues[prefix] = queue.Queue(max_pages_buffered)
+                            executor.submit(_list, prefix, queues[prefix])
+                    for key, prefix in shards:
+                        if prefix is None:
+                            yield _url(key)
+                            continue
+                        q = queues.pop(prefix)
+                        urls = _get(q)
+                        while urls is not _DONE:
+                            yield from urls
+                            urls = _get(q)
+                else:
+                    q = queue.Queue(max_pages_buffered * max_workers)
+                    running = 0
+                    for key, prefix in shards:
+                        if prefix is None:
+                            yield _url(key)
+                        else:
+                            executor.submit(_list, prefix, q)
+                            running += 1
+                    while running:
+                        urls = _get(q)
+                        if urls is _DONE:
+                            running -= 1
+                        else:
+                            yield from urls
+            finally:
+                stop.set()
+                # only wait for the listings already running
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def sync(
+        self,
+        src,
+        dst,
+        delete=False,
+        dry_run=False,
+        checksum=False,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> dict:
+        """
+        Synchronize a local directory and an S3 prefix, in either direction
+
+        Files are compared using the size and last modified time from the bucket
+        listing, without a request per object, and only new or changed files are
+        transferred. Downloaded files get the last modified time of the object,
+        so running the same sync again only costs the listing.
+
+        Returns a report of what was (or, in a dry run, would be) done: a dict
+        with the "transfer" (source, destination) pairs, the "delete" paths or
+        URLs, and the "errors" as (source, exception) pairs.
+
+        :param src: Source S3 URL or local directory
+        :param dst: Destination S3 URL or local directory
+        :param delete: Delete files in dst that are not in src
+        :param dry_run: Only report what would be done
+        :param checksum: Compare the MD5 of local files with the ETag of objects
+            of the same size, rather than the modified times. Objects uploaded
+            in parts do not have an MD5 ETag and are compared by time.
+        :param max_workers: Number of simultaneous transfers
+        """
+        upload = not src.startswith("s3://")
+        if upload == (not dst.startswith("s3://")):
+            raise Exception("sync needs one S3 URL and one local directory")
+        url, path = (dst, src) if upload else (src, dst)
+        # a missing source would look empty, and delete would empty the prefix
+        if upload and not op.isdir(path):
+            raise FileNotFoundError(f"sync source directory {path} does not exist")
+
+        parts = self.urlparse(url)
+        prefix = parts["key"]
+        if prefix and not prefix.endswith("/"):
+            prefix += "/"
+        url = f"s3://{parts['bucket']}/{prefix}"
+
+        remote = {}
+        for obj in self.find_objects(url):
+            name = obj.url[len(url) :]
+            if name and not name.endswith("/"):
+                remote[name] = obj
+
+        local = {}
+        for root, _, filenames in os.walk(path):
+            for filename in filenames:
+                fname = op.join(root, filename)
+                name = op.relpath(fname, path).replace(os.sep, "/")
+                local[name] = os.stat(fname)
+
+        def changed(name):
+            stat, obj = local[name], remote[name]
+            if stat.st_size != obj.size:
+                return True
+            if checksum and "-" not in obj.etag:
+                with open(op.join(path, name), "rb") as f:
+                    md5 = hashlib.md5()
+                    for chunk in iter(lambda: f.read(MB), b""):
+                        md5.update(chunk)
+                return md5.hexdigest() != obj.etag.strip('"')
+            # S3 times are to the second
+            local_time = int(stat.st_mtime)
+            remote_time = int(obj.last_modified.timestamp())
+            return local_time > remote_time if upload else remote_time > local_time
+
+        source, target = (local, remote) if upload else (remote, local)
+        names = [n for n in sorted(source) if n not in target or changed(n)]
+        extras = sorted(set(target) - set(source)) if delete else []
+
+        report = {"transfer": [], "delete": [], "errors": []}
+        for name in names:
+            pair = (op.join(path, name), url + name)
+            report["transfer"].append(pair if upload else pair[::-1])
+        report["delete"] = [url + n if upload else op.join(path, n) for n in extras]
+        if dry_run:
+            return report
+
+        if upload:
+            results = self.upload_many(report["transfer"], max_workers=max_workers)
+        else:
+
+            def _download(pair):
+                src_url, fout = pair
+                makedirs(op.dirname(fout) or ".", exist_ok=True)
+                self._download_to(src_url, fout)
+                mtime = remote[src_url[len(url) :]].last_modified.timestamp()
+                os.utime(fout, (mtime, mtime))
+
+            results = _map_concurrent(
+                _download, report["transfer"], max_workers=max_workers
+            )
+        for pair, _, error in results:
+            if error:
+                report["errors"].append((pair[0], error))
+
+        if upload:
+            for error in self.delete_many(report["delete"], max_workers=max_workers):
+                report["errors"].append((error["url"], Exception(error["message"])))
+        else:
+            for fname in report["delete"]:
+                os.remove(fname)
+        return report
 
     def read_inventory_file(
         self,
@@ -318,59 +1519,22 @@ class s3(object):
         key_contains=None,
         datetime_key="LastModifiedDate",
     ):
-        logger.debug("Reading inventory file %s" % (fname))
-
-        inv = [
-            {keys[i]: v for i, v in enumerate(line.replace('"', "").split(","))}
-            for line in self.read(fname).split("\n")
-        ]
-
-        def fvalid(info):
-            return True if "Key" in info and "Bucket" in info else False
-
-        def fprefix(info):
-            return True if info["Key"][: len(prefix)] == prefix else False
-
-        def fsuffix(info):
-            return True if info["Key"].endswith(suffix) else False
-
-        def fstartdate(info):
-            dt = datetime.strptime(info[datetime_key], "%Y-%m-%dT%H:%M:%S.%fZ").date()
-            return True if dt > start_date else False
-
-        def fenddate(info):
-            dt = datetime.strptime(info[datetime_key], "%Y-%m-%dT%H:%M:%S.%fZ").date()
-            return True if dt < end_date else False
-
-        def islatest(info):
-            latest = info.get("IsLatest")
-            if latest:
-                return latest not in ("false", False)
-            return True
-
-        def fcontains(info):
-            for part in key_contains:
-                if part not in info["Key"]:
-                    return False
-            return True
-
-        inv = filter(fvalid, inv)
-
-        if is_latest is not None:
-            inv - filter(islatest, inv)
-        if key_contains:
-            inv = filter(fcontains, inv)
-        if prefix:
-            inv = filter(fprefix, inv)
-        if suffix:
-            inv = filter(fsuffix, inv)
-        if start_date:
-            inv = filter(fstartdate, inv)
-        if end_date:
-            inv = filter(fenddate, inv)
-
-        for i in inv:
-            yield "s3://%s/%s" % (i["Bucket"], i["Key"])
+        """Generate the URLs of objects in an inventory file that match the filters"""
+        # imported here as s3inventory imports this module
+        from boto3utils.s3inventory import S3Inventory
+
+        yield from S3Inventory.filter_inventory_file(
+            fname,
+            keys,
+            prefix=prefix,
+            suffix=suffix,
+            start_date=start_date,
+            end_date=end_date,
+            is_latest=is_latest,
+            key_contains=key_contains,
+            datetime_key=datetime_key,
+            s3client=self,
+        )
 
     def latest_inventory_manifest(self, url, manifest_age_days=1):
         """Get latest inventory manifest file"""
@@ -421,6 +1585,163 @@ class s3(object):
                 yield from results
 
 
+# Key derivation functions. See:
+# http://docs.aws.amazon.com/general/latest/gr/signature-v4-examples.html#signature-v4-examples-python
+def _sign(key, msg):
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+@lru_cache(maxsize=64)
+def _signing_key(key, dateStamp, regionName, serviceName):
+    # the derived key only changes daily, so is cached rather than recomputed
+    kDate = _sign(("AWS4" + key).encode("utf-8"), dateStamp)
+    kRegion = _sign(kDate, regionName)
+    kService = _sign(kRegion, serviceName)
+    kSigning = _sign(kService, "aws4_request")
+    return kSigning
+
+
+class Presigner(object):
+    """Sign many S3 requests with the same credentials (AWS Signature Version 4)"""
+
+    algorithm = "AWS4-HMAC-SHA256"
+    service = "s3"
+
+    def __init__(
+        self,
+        access_key: str,
+        secret_key: str,
+        region: str = "eu-central-1",
+        session_token: Optional[str] = None,
+    ):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.session_token = session_token
+
+    @classmethod
+    def from_env(cls, aws_region=None) -> Optional["Presigner"]:
+        """Create a Presigner from environment variables, or None without credentials"""
+        access_key = os.environ.get(
+            "AWS_BUCKET_ACCESS_KEY_ID", os.environ.get("AWS_ACCESS_KEY_ID")
+        )
+        secret_key = os.environ.get(
+            "AWS_BUCKET_SECRET_ACCESS_KEY", os.environ.get("AWS_SECRET_ACCESS_KEY")
+        )
+        region = os.environ.get(
+            "AWS_BUCKET_REGION", os.environ.get("AWS_REGION", "eu-central-1")
+        )
+        if aws_region is not None:
+            region = aws_region
+        if access_key is None or secret_key is None:
+            return None
+        session_token = None
+        if "AWS_BUCKET_ACCESS_KEY_ID" not in os.environ:
+            session_token = os.environ.get("AWS_SESSION_TOKEN")
+        return cls(access_key, secret_key, region=region, session_token=session_token)
+
+    def sign(
+        self,
+        url,
+        rtype="GET",
+        public=False,
+        requester_pays=False,
+        content_type=None,
+        now: Optional[datetime] = None,
+    ) -> Tuple[str, dict]:
+        """
+        Sign a request for an S3 URL, returning the https URL and the headers
+
+        :param url: S3 URL to sign
+        :param rtype: HTTP method of the request
+        :param public: Sign the request with a public-read ACL
+        :param requester_pays: Sign the request for a requester pays bucket
+        :param content_type: Content type added to the headers (not signed)
+        :param now: Time of the request, defaults to the current time
+        """
+        parts = s3.urlparse(url)
+        bucket = parts["bucket"]
+        key = parts["key"]
+
+        host = "%s.%s.amazonaws.com" % (bucket, self.service)
+        request_parameters = ""
+
+        # Create a date for headers and the credential string
+        t = now or datetime.utcnow()
+        amzdate = t.strftime("%Y%m%dT%H%M%SZ")
+        datestamp = amzdate[:8]  # Date w/o time, used in credential scope
+
+        # create signed request and headers
+        canonical_uri = "/" + key
+        canonical_querystring = request_parameters
+
+        payload_hash = "UNSIGNED-PAYLOAD"
+        headers = {
+            "host": host,
+            "x-amz-content-sha256": payload_hash,
+            "x-amz-date": amzdate,
+        }
+
+        if requester_pays:
+            headers["x-amz-request-payer"] = "requester"
+        if public:
+            headers["x-amz-acl"] = "public-read"
+        if self.session_token:
+            headers["x-amz-security-token"] = self.session_token
+        signed_names = sorted(headers)
+        canonical_headers = (
+            "\n".join("%s:%s" % (key, headers[key]) for key in signed_names) + "\n"
+        )
+        signed_headers = ";".join(signed_names)
+
+        canonical_request = "%s\n%s\n%s\n%s\n%s\n%s" % (
+            rtype,
+            canonical_uri,
+            canonical_querystring,
+            canonical_headers,
+            signed_headers,
+            payload_hash,
+        )
+        credential_scope = "%s/%s/%s/aws4_request" % (
+            datestamp,
+            self.region,
+            self.service,
+        )
+        string_to_sign = "%s\n%s\n%s\n%s" % (
+            self.algorithm,
+            amzdate,
+            credential_scope,
+            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+        )
+        signing_key = _signing_key(
+            self.secret_key, datestamp, self.region, self.service
+        )
+        signature = hmac.new(
+            signing_key, string_to_sign.encode("utf-8"), hashlib.sha256
+        ).hexdigest()
+        authorization_header = "%s Credential=%s/%s, SignedHeaders=%s, Signature=%s" % (
+            self.algorithm,
+            self.access_key,
+            credential_scope,
+            signed_headers,
+            signature,
+        )
+
+        request_url = "https://%s%s" % (host, canonical_uri)
+        headers["Authorization"] = authorization_header
+        if content_type is not None:
+            headers["content-type"] = content_type
+        return request_url, headers
+
+    def sign_many(self, urls: Iterable[str], **kwargs) -> list:
+        """
+        Sign requests for many S3 URLs at the same time, returning a list of
+        (https URL, headers) tuples. Keyword arguments are passed to sign().
+        """
+        now = kwargs.pop("now", None) or datetime.utcnow()
+        return [self.sign(url, now=now, **kwargs) for url in urls]
+
+
 def get_presigned_url(
     url,
     aws_region=None,
@@ -430,112 +1751,16 @@ def get_presigned_url(
     content_type=None,
 ):
     """Get presigned URL"""
-    access_key = os.environ.get(
-        "AWS_BUCKET_ACCESS_KEY_ID", os.environ.get("AWS_ACCESS_KEY_ID")
-    )
-    secret_key = os.environ.get(
-        "AWS_BUCKET_SECRET_ACCESS_KEY", os.environ.get("AWS_SECRET_ACCESS_KEY")
-    )
-    region = os.environ.get(
-        "AWS_BUCKET_REGION", os.environ.get("AWS_REGION", "eu-central-1")
-    )
-    if aws_region is not None:
-        region = aws_region
-    if access_key is None or secret_key is None:
+    presigner = Presigner.from_env(aws_region=aws_region)
+    if presigner is None:
         # if credentials not provided, just try to download without signed URL
         logger.debug("Not using signed URL for %s" % url)
         return url, None
 
-    parts = s3.urlparse(url)
-    bucket = parts["bucket"]
-    key = parts["key"]
-
-    service = "s3"
-    host = "%s.%s.amazonaws.com" % (bucket, service)
-    request_parameters = ""
-
-    # Key derivation functions. See:
-    # http://docs.aws.amazon.com/general/latest/gr/signature-v4-examples.html#signature-v4-examples-python
-    def sign(key, msg):
-        return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
-
-    def getSignatureKey(key, dateStamp, regionName, serviceName):
-        kDate = sign(("AWS4" + key).encode("utf-8"), dateStamp)
-        kRegion = sign(kDate, regionName)
-        kService = sign(kRegion, serviceName)
-        kSigning = sign(kService, "aws4_request")
-        return kSigning
-
-    # Create a date for headers and the credential string
-    t = datetime.utcnow()
-    amzdate = t.strftime("%Y%m%dT%H%M%SZ")
-    datestamp = t.strftime("%Y%m%d")  # Date w/o time, used in credential scope
-
-    # create signed request and headers
-    canonical_uri = "/" + key
-    canonical_querystring = request_parameters
-
-    payload_hash = "UNSIGNED-PAYLOAD"
-    headers = {
-        "host": host,
-        "x-amz-content-sha256": payload_hash,
-        "x-amz-date": amzdate,
-    }
-
-    if requester_pays:
-        headers["x-amz-request-payer"] = "requester"
-    if public:
-        headers["x-amz-acl"] = "public-read"
-    if (
-        os.environ.get("AWS_SESSION_TOKEN")
-        and "AWS_BUCKET_ACCESS_KEY_ID" not in os.environ
-    ):
-        headers["x-amz-security-token"] = os.environ.get("AWS_SESSION_TOKEN")
-    canonical_headers = (
-        "\n".join("%s:%s" % (key, headers[key]) for key in sorted(headers)) + "\n"
-    )
-    signed_headers = ";".join(sorted(headers.keys()))
-
-    canonical_request = "%s\n%s\n%s\n%s\n%s\n%s" % (
-        rtype,
-        canonical_uri,
-        canonical_querystring,
-        canonical_headers,
-        signed_headers,
-        payload_hash,
+    return presigner.sign(
+        url,
+        rtype=rtype,
+        public=public,
+        requester_pays=requester_pays,
+        content_type=content_type,
     )
-    algorithm = "AWS4-HMAC-SHA256"
-    credential_scope = datestamp + "/" + region + "/" + service + "/" + "aws4_request"
-    string_to_sign = (
-        algorithm
-        + "\n"
-        + amzdate
-        + "\n"
-        + credential_scope
-        + "\n"
-        + hashlib.sha256(canonical_request.encode("utf-8")).hexdigest()
-    )
-    signing_key = getSignatureKey(secret_key, datestamp, region, service)
-    signature = hmac.new(
-        signing_key, string_to_sign.encode("utf-8"), hashlib.sha256
-    ).hexdigest()
-    authorization_header = (
-        algorithm
-        + " "
-        + "Credential="
-        + access_key
-        + "/"
-        + credential_scope
-        + ", "
-        + "SignedHeaders="
-        + signed_headers
-        + ", "
-        + "Signature="
-        + signature
-    )
-
-    request_url = "https://%s%s" % (host, canonical_uri)
-    headers["Authorization"] = authorization_header
-    if content_type is not None:
-        headers["content-type"] = content_type
-    return request_url, headers
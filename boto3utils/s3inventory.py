@@ -1,30 +1,223 @@
-from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import csv
+from collections import namedtuple
+from datetime import datetime, time, timedelta, timezone
+from functools import lru_cache
+import hashlib
+import heapq
 import json
 import logging
+import os
+import os.path as op
 from pathlib import Path
-from typing import Optional
+import pickle
+import re
+import sqlite3
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from typing import Callable, Iterator, NamedTuple, Optional, Sequence
 
 from boto3utils import s3
-from dateutil.parser import parse
+from boto3utils.s3 import clear_clients
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=32)
+def _row_type(schema: tuple):
+    """Record type for the rows of an inventory with this schema"""
+    # rename=True replaces column names that are not identifiers, e.g. "x-y"
+    return namedtuple("InventoryRow", schema, rename=True)
+
+
+# inventory formats read with pyarrow, by fileFormat in the manifest
+COLUMNAR_FORMATS = ("Parquet", "ORC")
+
+
+def _file_format(fname: str) -> str:
+    """Format of an inventory file, from its extension"""
+    if fname.endswith(".parquet"):
+        return "Parquet"
+    if fname.endswith(".orc"):
+        return "ORC"
+    return "CSV"
+
+
+def _parse_schema(file_schema: str, file_format: str = "CSV") -> list:
+    """Field names from the fileSchema of an inventory manifest"""
+    if file_format == "Parquet":
+        # message s3.inventory { required binary bucket (STRING); ... }
+        return re.findall(r"(?:required|optional|repeated)\s+\S+\s+(\w+)", file_schema)
+    if file_format == "ORC":
+        # struct<bucket:string,key:string,...>
+        fields = file_schema.strip()[len("struct<") : -1]
+        return [f.split(":")[0].strip() for f in fields.split(",")]
+    return [str(key).strip() for key in file_schema.split(",")]
+
+
+def _column_name(field: str, schema: Sequence[str]) -> str:
+    """
+    Name of a CSV inventory field (e.g. LastModifiedDate) in the schema, which
+    for Parquet and ORC inventories is in snake case (e.g. last_modified_date)
+    """
+    if field in schema:
+        return field
+    return re.sub(r"(?<!^)(?=[A-Z][a-z])", "_", field).lower()
+
+
+def compile_filter(
+    schema: Sequence[str],
+    prefix=None,
+    suffix=None,
+    start_date=None,
+    end_date=None,
+    is_latest=None,
+    key_contains=None,
+    datetime_key="LastModifiedDate",
+) -> Optional[Callable[[Sequence[str]], bool]]:
+    """
+    Compile the filters of S3Inventory.filter_inventory_file() into a single
+    predicate on the values of a CSV inventory row, in schema order
+
+    Dates are compared as the first 10 characters (YYYY-MM-DD) of the ISO 8601
+    timestamps, without parsing them. Returns None if there are no filters.
+    """
+    schema = list(schema)
+    key = schema.index(_column_name("Key", schema))
+    parts = tuple(key_contains or ())
+    start = start_date.isoformat()[:10] if start_date else None
+    end = end_date.isoformat()[:10] if end_date else None
+    dt = schema.index(_column_name(datetime_key, schema)) if start or end else None
+    latest = _column_name("IsLatest", schema)
+    latest = (
+        schema.index(latest) if is_latest is not None and latest in schema else None
+    )
+
+    if not (prefix or suffix or parts or dt is not None or latest is not None):
+        return None
+
+    def predicate(row):
+        value = row[key]
+        if prefix and not value.startswith(prefix):
+            return False
+        if suffix and not value.endswith(suffix):
+            return False
+        for part in parts:
+            if part not in value:
+                return False
+        if dt is not None:
+            day = row[dt][:10]
+            if start and day <= start:
+                return False
+            if end and day >= end:
+                return False
+        return latest is None or row[latest] != "false"
+
+    return predicate
+
+
+def _pyarrow_dataset():
+    try:
+        import pyarrow.dataset
+    except ImportError as e:
+        raise ImportError(
+            "Reading Parquet and ORC inventories requires pyarrow, "
+            "install with `pip install boto3-utils[parquet]`"
+        ) from e
+    return pyarrow.dataset
+
+
+# s3 arguments passed on to the worker processes of S3Inventory.scan(), which
+# create their own clients
+WORKER_S3_ARGS = (
+    "requester_pays",
+    "endpoint_url",
+    "max_pool_connections",
+    "per_region_clients",
+)
+
+
+# most sorted runs merged at once by S3Inventory.diff(), each an open file
+MAX_MERGE_RUNS = 256
+
+# rows written to, and read back from, sorted runs at a time
+RUN_BATCH_ROWS = 1000
+
+
+class InventoryChange(NamedTuple):
+    """An object added, removed or modified between two inventories"""
+
+    change: str  # "added", "removed" or "modified"
+    url: str
+    size: str  # the size and ETag in the newer inventory, or last seen if removed
+    etag: str
+
+
+def _write_run(rows: list, tmpdir: str) -> str:
+    """Save sorted rows to a temporary file, returning its name"""
+    with NamedTemporaryFile("wb", dir=tmpdir, suffix=".run", delete=False) as f:
+        for i in range(0, len(rows), RUN_BATCH_ROWS):
+            pickle.dump(rows[i : i + RUN_BATCH_ROWS], f, pickle.HIGHEST_PROTOCOL)
+    return f.name
+
+
+def _read_run(fname: str) -> Iterator[tuple]:
+    with open(fname, "rb") as f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                return
+            yield from batch
+
+
+def _write_merged_run(runs: list, tmpdir: str) -> str:
+    """Merge sorted runs into one, a batch of rows at a time"""
+    with NamedTemporaryFile("wb", dir=tmpdir, suffix=".run", delete=False) as f:
+        batch = []
+        for row in heapq.merge(*map(_read_run, runs)):
+            batch.append(row)
+            if len(batch) == RUN_BATCH_ROWS:
+                pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+                batch = []
+        if batch:
+            pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+    for fname in runs:
+        os.remove(fname)
+    return f.name
+
+
+def _scan_file(fname, schema, filters: dict, s3_args: dict) -> list:
+    """Filter one inventory file in a worker process"""
+    s3client = s3(**s3_args)
+    return list(
+        S3Inventory.filter_inventory_file(fname, schema, s3client=s3client, **filters)
+    )
+
+
 class S3Inventory(object):
     def __init__(self, href, date: str = datetime.now(), max_age: int = 5, **kwargs):
         self.href = href
         self.s3client = s3(**kwargs)
+        self.s3_args = {k: v for k, v in kwargs.items() if k in WORKER_S3_ARGS}
+        self._kwargs = kwargs
 
-        self.datetime = parse(date) if isinstance(date, str) else date
+        if isinstance(date, str):
+            from dateutil.parser import parse
+
+            date = parse(date)
+        self.datetime = date
 
         self.manifest = self.read_manifest(
             href, self.datetime, max_age=max_age, s3client=self.s3client
         )
+        if self.manifest is None:
+            raise ValueError(
+                f"No inventory manifest for {href} in the {max_age} days to {date}"
+            )
 
-        # get file schema
-        self.schema = [
-            str(key).strip() for key in self.manifest["fileSchema"].split(",")
-        ]
+        # get file format and schema
+        self.file_format = self.manifest.get("fileFormat", "CSV")
+        self.schema = _parse_schema(self.manifest["fileSchema"], self.file_format)
 
     @classmethod
     def read_manifest(
@@ -63,15 +256,130 @@ class S3Inventory(object):
         return ["s3://%s/%s" % (bucket, f["key"]) for f in files]
 
     @classmethod
-    def read_inventory_file(cls, fname, schema, s3client: Optional["s3"] = None):
+    def _csv_rows(cls, fname, ncols: int, s3client: "s3") -> Iterator[list]:
+        """Generate the values of each complete row of an inventory CSV file"""
         logger.debug("Reading inventory file %s" % (fname))
+        # iter_lines removes the line endings, which csv needs to keep newlines
+        # inside quoted values
+        lines = (line + "\n" for line in s3client.iter_lines(fname))
+        for values in csv.reader(lines):
+            if len(values) == ncols:
+                yield values
+            elif values:
+                logger.warning(
+                    f"Skipping row with {len(values)} values in {fname}, "
+                    f"expected {ncols}"
+                )
 
-        inv = [
-            {schema[i]: v for i, v in enumerate(line.replace('"', "").split(","))}
-            for line in s3client.read(fname).split("\n")
-        ]
+    @classmethod
+    def _columnar_fragment(cls, fname, s3client: "s3"):
+        """Open a Parquet or ORC inventory file, read into memory, for scanning"""
+        ds = _pyarrow_dataset()
+        import pyarrow
 
-        return inv
+        logger.debug("Reading inventory file %s" % (fname))
+        parts = s3client.urlparse(fname)
+        data = s3client.get_object(parts["bucket"], parts["key"])["Body"].read()
+        if _file_format(fname) == "ORC":
+            file_format = ds.OrcFileFormat()
+        else:
+            file_format = ds.ParquetFileFormat()
+        return file_format.make_fragment(pyarrow.BufferReader(data))
+
+    @classmethod
+    def _columnar_filter(
+        cls,
+        fragment,
+        prefix=None,
+        suffix=None,
+        start_date=None,
+        end_date=None,
+        is_latest=None,
+        key_contains=None,
+        datetime_key="LastModifiedDate",
+    ):
+        """pyarrow expression for the filters of filter_inventory_file"""
+        ds = _pyarrow_dataset()
+        import pyarrow
+        import pyarrow.compute as pc
+
+        schema = fragment.physical_schema
+        key = ds.field("key")
+        conditions = []
+        if is_latest is not None and "is_latest" in schema.names:
+            latest = ds.field("is_latest")
+            conditions.append(latest.is_null() | (latest != False))  # noqa: E712
+        for part in key_contains or []:
+            conditions.append(pc.match_substring(key, part))
+        if prefix:
+            conditions.append(pc.starts_with(key, prefix))
+        if suffix:
+            conditions.append(pc.ends_with(key, suffix))
+        if start_date or end_date:
+            name = _column_name(datetime_key, schema.names)
+            dtype = schema.field(name).type
+
+            def bound(day):
+                if pyarrow.types.is_timestamp(dtype):
+                    tz = timezone.utc if dtype.tz else None
+                    value = datetime.combine(day, time(), tzinfo=tz)
+                    return pyarrow.scalar(value, dtype)
+                # ISO 8601 strings sort in date order
+                return day.isoformat()
+
+            # dates after start_date, and before end_date, as for CSV
+            if start_date:
+                lower = bound(start_date + timedelta(days=1))
+                conditions.append(ds.field(name) >= lower)
+            if end_date:
+                conditions.append(ds.field(name) < bound(end_date))
+
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    @classmethod
+    def iter_inventory_file(
+        cls, fname, schema: Sequence[str], s3client: Optional["s3"] = None
+    ) -> Iterator[tuple]:
+        """
+        Generate the rows of an inventory CSV file as namedtuples with the schema
+        fields as attributes
+
+        The file is decompressed and parsed incrementally, so memory use does not
+        depend on the number of rows. Quoted values, which may contain commas,
+        quotes or newlines, are handled. Empty rows, and rows that do not have
+        a value for every column, are skipped.
+
+        Parquet and ORC files (requires pyarrow) are read a batch at a time,
+        projected to the columns in `schema`, with typed values.
+        """
+        if s3client is None:
+            s3client = s3()
+        Row = _row_type(tuple(schema))
+        if _file_format(fname) in COLUMNAR_FORMATS:
+            return cls._iter_columnar_file(fname, list(schema), Row, s3client)
+        return map(Row._make, cls._csv_rows(fname, len(schema), s3client))
+
+    @classmethod
+    def _iter_columnar_file(cls, fname, columns, Row, s3client):
+        fragment = cls._columnar_fragment(fname, s3client)
+        for batch in fragment.to_batches(columns=columns):
+            yield from map(Row._make, zip(*(c.to_pylist() for c in batch.columns)))
+
+    @classmethod
+    def read_inventory_file(cls, fname, schema, s3client: Optional["s3"] = None):
+        """Read all rows of an inventory file as a list of dicts"""
+        if s3client is None:
+            s3client = s3()
+        if _file_format(fname) in COLUMNAR_FORMATS:
+            fragment = cls._columnar_fragment(fname, s3client)
+            return fragment.to_table(columns=list(schema)).to_pylist()
+        return [
+            dict(zip(schema, values))
+            for values in cls._csv_rows(fname, len(schema), s3client)
+        ]
 
     @classmethod
     def save_inventory_file(
@@ -81,9 +389,26 @@ class S3Inventory(object):
         if not fout.exists() or overwrite:
             inv = cls.read_inventory_file(fname, schema, s3client)
             with open(fout, "w") as f:
-                f.write(json.dumps(inv))
+                f.write(json.dumps(inv, default=str))
         return fout
 
+    def snapshot(self, path: str, mmap_size: int = 1024**3) -> "InventorySnapshot":
+        """
+        Open a local snapshot of all the inventory files of the manifest,
+        reading the files into a new snapshot in directory `path` if there is
+        none for this manifest yet
+
+        Snapshots are named by the source bucket, manifest date and a checksum
+        of the inventory files, so a new or changed manifest makes a new one.
+        """
+        os.makedirs(path, exist_ok=True)
+        fname = op.join(path, snapshot_name(self.manifest))
+        if not op.exists(fname):
+            InventorySnapshot.build(
+                fname, self.inventory_file_hrefs(), self.schema, self.s3client
+            )
+        return InventorySnapshot(fname, mmap_size=mmap_size)
+
     @classmethod
     def filter_inventory_file(
         cls,
@@ -96,58 +421,206 @@ class S3Inventory(object):
         is_latest=None,
         key_contains=None,
         datetime_key="LastModifiedDate",
-        s3client: "s3" = s3(),
+        s3client: Optional["s3"] = None,
     ):
-        inv = cls.read_inventory_file(fname, schema, s3client=s3client)
-
-        def fvalid(info):
-            return True if "Key" in info and "Bucket" in info else False
-
-        def fprefix(info):
-            return True if info["Key"][: len(prefix)] == prefix else False
-
-        def fsuffix(info):
-            return True if info["Key"].endswith(suffix) else False
-
-        def fstartdate(info):
-            dt = datetime.strptime(info[datetime_key], "%Y-%m-%dT%H:%M:%S.%fZ").date()
-            return True if dt > start_date else False
-
-        def fenddate(info):
-            dt = datetime.strptime(info[datetime_key], "%Y-%m-%dT%H:%M:%S.%fZ").date()
-            return True if dt < end_date else False
-
-        def islatest(info):
-            latest = info.get("IsLatest")
-            if latest:
-                return latest not in ("false", False)
-            return True
-
-        def fcontains(info):
-            for part in key_contains:
-                if part not in info["Key"]:
-                    return False
-            return True
-
-        inv = filter(fvalid, inv)
-
-        if is_latest is not None:
-            inv = filter(islatest, inv)
-        if key_contains:
-            inv = filter(fcontains, inv)
-        if prefix:
-            inv = filter(fprefix, inv)
-        if suffix:
-            inv = filter(fsuffix, inv)
-        if start_date:
-            inv = filter(fstartdate, inv)
-        if end_date:
-            inv = filter(fenddate, inv)
+        if s3client is None:
+            s3client = s3()
 
-        _i = -1
-        for _i, i in enumerate(inv):
-            yield "s3://%s/%s" % (i["Bucket"], i["Key"])
-        logger.info(f"Matched {_i+1} files")
+        if _file_format(fname) in COLUMNAR_FORMATS:
+            # filter in the scan, reading only the bucket, key and filter columns
+            fragment = cls._columnar_fragment(fname, s3client)
+            expression = cls._columnar_filter(
+                fragment,
+                prefix=prefix,
+                suffix=suffix,
+                start_date=start_date,
+                end_date=end_date,
+                is_latest=is_latest,
+                key_contains=key_contains,
+                datetime_key=datetime_key,
+            )
+            count = 0
+            batches = fragment.to_batches(columns=["bucket", "key"], filter=expression)
+            for batch in batches:
+                buckets, keys = batch.columns
+                for bucket, key in zip(buckets.to_pylist(), keys.to_pylist()):
+                    yield "s3://%s/%s" % (bucket, key)
+                count += batch.num_rows
+            logger.info(f"Matched {count} files")
+            return
+
+        if "Key" not in schema or "Bucket" not in schema:
+            logger.warning(f"Inventory schema {schema} has no Bucket and Key")
+            return
+
+        predicate = compile_filter(
+            schema,
+            prefix=prefix,
+            suffix=suffix,
+            start_date=start_date,
+            end_date=end_date,
+            is_latest=is_latest,
+            key_contains=key_contains,
+            datetime_key=datetime_key,
+        )
+        rows = cls._csv_rows(fname, len(schema), s3client)
+        if predicate:
+            rows = filter(predicate, rows)
+
+        bucket, key = schema.index("Bucket"), schema.index("Key")
+        count = 0
+        for row in rows:
+            count += 1
+            yield "s3://%s/%s" % (row[bucket], row[key])
+        logger.info(f"Matched {count} files")
+
+    def scan(
+        self,
+        filters: Optional[dict] = None,
+        workers: Optional[int] = None,
+        ordered: bool = False,
+        progress: Optional[Callable] = None,
+    ) -> Iterator[str]:
+        """
+        Filter all the inventory files of the manifest in a pool of processes,
+        generating the URLs of matching objects
+
+        Each worker process creates its own client, from the `requester_pays`,
+        `endpoint_url`, `max_pool_connections` and `per_region_clients`
+        arguments of this inventory.
+
+        :param filters: Keyword arguments for filter_inventory_file()
+        :param workers: Number of processes, defaults to the number of CPUs
+        :param ordered: Generate URLs in the order of the inventory files,
+            otherwise URLs are generated as each file is finished
+        :param progress: Called as progress(done, total, href, matched) after
+            each inventory file is filtered
+        """
+        filters = filters or {}
+        hrefs = self.inventory_file_hrefs()
+        executor = ProcessPoolExecutor(workers, initializer=clear_clients)
+        try:
+            futures = {
+                executor.submit(
+                    _scan_file, href, self.schema, filters, self.s3_args
+                ): href
+                for href in hrefs
+            }
+            done = futures if ordered else as_completed(futures)
+            total = 0
+            for n, future in enumerate(done, 1):
+                urls = future.result()
+                total += len(urls)
+                if progress:
+                    progress(n, len(hrefs), futures[future], len(urls))
+                yield from urls
+            logger.info(f"Matched {total} total files in {len(hrefs)} inventory files")
+        finally:
+            # stop reading files if the caller stops early or a file fails
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _object_rows(self, href) -> Iterator[tuple]:
+        """
+        Generate (key, size, etag) of the current version of each object in an
+        inventory file, leaving out older versions and delete markers
+        """
+        columnar = self.file_format in COLUMNAR_FORMATS
+        columns = [_column_name(f, self.schema) for f in ("Key", "Size", "ETag")]
+        # (position, value) of the columns of rows to leave out, if versioned
+        skip = []
+        for field, value in (("IsLatest", "false"), ("IsDeleteMarker", "true")):
+            name = _column_name(field, self.schema)
+            if name in self.schema:
+                skip.append((len(columns), value == "true" if columnar else value))
+                columns.append(name)
+
+        if columnar:
+            rows = self.iter_inventory_file(href, columns, s3client=self.s3client)
+        else:
+            index = [self.schema.index(name) for name in columns]
+            rows = (
+                [row[i] for i in index]
+                for row in self._csv_rows(href, len(self.schema), self.s3client)
+            )
+        for row in rows:
+            if any(row[i] == value for i, value in skip):
+                continue
+            key, size, etag = row[:3]
+            yield key, "" if size is None else str(size), etag or ""
+
+    def _sorted_rows(self, tmpdir: str, buffer_rows: int) -> Iterator[tuple]:
+        """
+        Generate (key, size, etag) of all objects in the inventory in key order,
+        sorting runs of up to buffer_rows rows in memory and merging them from
+        temporary files in tmpdir
+        """
+        runs = []
+        for href in self.inventory_file_hrefs():
+            rows = []
+            # inventory files are usually sorted already, making each sort linear
+            for row in self._object_rows(href):
+                rows.append(row)
+                if len(rows) == buffer_rows:
+                    runs.append(_write_run(sorted(rows), tmpdir))
+                    rows = []
+            if rows:
+                runs.append(_write_run(sorted(rows), tmpdir))
+            # merge runs early, to keep the number of files open when merging
+            # below MAX_MERGE_RUNS
+            while len(runs) >= MAX_MERGE_RUNS:
+                runs.append(_write_merged_run(runs[:MAX_MERGE_RUNS], tmpdir))
+                del runs[:MAX_MERGE_RUNS]
+        return heapq.merge(*map(_read_run, runs))
+
+    def diff(
+        self,
+        other_date,
+        buffer_rows: int = 1000000,
+        tmpdir: Optional[str] = None,
+    ) -> Iterator[InventoryChange]:
+        """
+        Compare with the inventory of another date, generating the objects
+        added, removed and modified (size or ETag changed) since that date
+
+        Both inventories are sorted by key with an external merge sort, so
+        memory use depends on buffer_rows rather than the size of the bucket.
+        Only current versions of objects are compared, delete markers are
+        treated as removed objects.
+
+        :param other_date: Date of the earlier inventory, or an S3Inventory
+        :param buffer_rows: Most rows sorted in memory at a time
+        :param tmpdir: Directory for the sorted runs, defaults to the system
+            temporary directory
+        """
+        if isinstance(other_date, S3Inventory):
+            other = other_date
+        else:
+            other = S3Inventory(self.href, date=other_date, max_age=1, **self._kwargs)
+        bucket = self.manifest["sourceBucket"]
+
+        with TemporaryDirectory(dir=tmpdir) as path:
+            old = other._sorted_rows(path, buffer_rows)
+            new = self._sorted_rows(path, buffer_rows)
+            a, b = next(old, None), next(new, None)
+            counts = dict.fromkeys(("added", "removed", "modified"), 0)
+            while a is not None or b is not None:
+                if b is None or (a is not None and a[0] < b[0]):
+                    change, row = "removed", a
+                    a = next(old, None)
+                elif a is None or b[0] < a[0]:
+                    change, row = "added", b
+                    b = next(new, None)
+                else:
+                    change, row = ("modified" if a[1:] != b[1:] else None), b
+                    a, b = next(old, None), next(new, None)
+                if change:
+                    counts[change] += 1
+                    yield InventoryChange(
+                        change, "s3://%s/%s" % (bucket, row[0]), *row[1:]
+                    )
+            logger.info(
+                "%(added)s added, %(removed)s removed, %(modified)s modified" % counts
+            )
 
     def latest_inventory_files(self, url, manifest=None):
         if not manifest:
@@ -179,23 +652,151 @@ class S3Inventory(object):
                 yield from results
 
 
+def snapshot_name(manifest: dict) -> str:
+    """File name of the snapshot of an inventory manifest"""
+    checksum = hashlib.sha256()
+    for value in (manifest.get("fileFormat", "CSV"), manifest["fileSchema"]):
+        checksum.update(value.encode("utf-8") + b"\0")
+    for f in manifest.get("files", []):
+        checksum.update(
+            ("%s:%s" % (f["key"], f["MD5checksum"])).encode("utf-8") + b"\0"
+        )
+    return "%s-%s-%s.sqlite" % (
+        manifest.get("sourceBucket", "inventory"),
+        manifest["datetime"],
+        checksum.hexdigest()[:16],
+    )
+
+
+class InventorySnapshot(object):
+    """
+    Local SQLite database of all the rows of an inventory, indexed by key
+
+    Snapshots are built once with InventorySnapshot.build() (or
+    S3Inventory.snapshot()) and are then read only, memory mapped, so
+    repeated queries make no requests and do not parse the inventory again.
+    """
+
+    def __init__(self, fname: str, mmap_size: int = 1024**3):
+        """
+        :param fname: Snapshot file
+        :param mmap_size: Bytes of the file to memory map
+        """
+        self.fname = fname
+        uri = Path(fname).absolute().as_uri() + "?mode=ro"
+        self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self.conn.execute("PRAGMA mmap_size=%d" % mmap_size)
+        self.schema = [r[1] for r in self.conn.execute("PRAGMA table_info(objects)")]
+
+    @classmethod
+    def build(cls, fname, hrefs: Sequence[str], schema, s3client: "s3"):
+        """Read inventory files into a new snapshot file"""
+        columns = ", ".join(
+            '"%s"%s'
+            % (name, " INTEGER" if name == _column_name("Size", schema) else "")
+            for name in schema
+        )
+        path = op.dirname(op.abspath(fname))
+        with NamedTemporaryFile(dir=path, suffix=".tmp", delete=False) as f:
+            tmpname = f.name
+        try:
+            conn = sqlite3.connect(tmpname)
+            conn.execute("PRAGMA journal_mode=OFF")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("CREATE TABLE objects (%s)" % columns)
+            insert = "INSERT INTO objects VALUES (%s)" % ", ".join("?" * len(schema))
+            for i, href in enumerate(hrefs):
+                logger.info(f"Adding inventory file {i+1}/{len(hrefs)} to snapshot")
+                rows = S3Inventory.iter_inventory_file(href, schema, s3client=s3client)
+                if _file_format(href) in COLUMNAR_FORMATS:
+                    # sqlite stores dates as ISO 8601 text
+                    rows = (
+                        [v.isoformat() if isinstance(v, datetime) else v for v in row]
+                        for row in rows
+                    )
+                conn.executemany(insert, rows)
+            conn.execute(
+                'CREATE INDEX objects_key ON objects ("%s")'
+                % _column_name("Key", schema)
+            )
+            conn.commit()
+            conn.close()
+            os.replace(tmpname, fname)
+        except BaseException:
+            os.remove(tmpname)
+            raise
+        logger.info(f"Saved inventory snapshot {fname}")
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT count(*) FROM objects").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def query(
+        self,
+        prefix=None,
+        suffix=None,
+        start_date=None,
+        end_date=None,
+        is_latest=None,
+        key_contains=None,
+        datetime_key="LastModifiedDate",
+    ) -> Iterator[str]:
+        """
+        Generate the URLs of objects in the snapshot, with the same filters as
+        S3Inventory.filter_inventory_file()
+        """
+        bucket = '"%s"' % _column_name("Bucket", self.schema)
+        key = '"%s"' % _column_name("Key", self.schema)
+        where, params = [], []
+        if prefix:
+            # a range of keys, so the key index is used
+            where.append(f"{key} >= ?")
+            params.append(prefix)
+            if ord(prefix[-1]) < 0x10FFFF:
+                where.append(f"{key} < ?")
+                params.append(prefix[:-1] + chr(ord(prefix[-1]) + 1))
+        if suffix:
+            where.append(f"substr({key}, -?) = ?")
+            params += [len(suffix), suffix]
+        for part in key_contains or []:
+            where.append(f"instr({key}, ?) > 0")
+            params.append(part)
+        if start_date or end_date:
+            # dates are ISO 8601, so the first 10 characters sort by date
+            dt = 'substr("%s", 1, 10)' % _column_name(datetime_key, self.schema)
+            if start_date:
+                where.append(f"{dt} > ?")
+                params.append(start_date.isoformat()[:10])
+            if end_date:
+                where.append(f"{dt} < ?")
+                params.append(end_date.isoformat()[:10])
+        latest = _column_name("IsLatest", self.schema)
+        if is_latest is not None and latest in self.schema:
+            where.append(f'("{latest}" IS NULL OR "{latest}" NOT IN (\'false\', 0))')
+
+        sql = f"SELECT {bucket}, {key} FROM objects"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        for row in self.conn.execute(sql, params):
+            yield "s3://%s/%s" % row
+
+
 if __name__ == "__main__":
     logging.basicConfig(level="INFO", format="%(asctime)s [%(levelname)8s] %(message)s")
     inv = S3Inventory(
         "s3://sentinel-inventory/sentinel-s2-l2a/sentinel-s2-l2a-inventory",
         date="2022-10-31",
     )
-    hrefs = inv.inventory_file_hrefs()
-    num_files = len(hrefs)
-    filters = {"suffix": "tileInfo.json"}
-    total = 0
-    for i, fname in enumerate(hrefs):
-        logger.info(f"Reading inventory file {i+1}/{num_files}: {fname}")
-        filenames = []
-        finv = inv.filter_inventory_file(
-            fname, inv.schema, s3client=inv.s3client, **filters
-        )
-        for f in finv:
-            filenames.append(f)
-        total += len(filenames)
-    logger.info(f"Matched {total} total files in {num_files} inventory files")
+
+    def progress(done, total, href, matched):
+        logger.info(f"Read inventory file {done}/{total}: {href} ({matched} matched)")
+
+    filenames = list(inv.scan({"suffix": "tileInfo.json"}, progress=progress))
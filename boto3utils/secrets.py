@@ -1,13 +1,19 @@
 import base64
-import boto3
 import json
+from typing import Optional
 
+from boto3utils.metrics import Metrics
 
-def get_secret(secret_name):
+
+def get_secret(secret_name, metrics: Optional[Metrics] = None):
     """Get secrets as a dictionary from Secrets Manager"""
+    import boto3
+
     # Create a Secrets Manager client
     session = boto3.session.Session()
     client = session.client(service_name="secretsmanager")
+    if metrics is not None:
+        metrics.attach(client)
 
     # Will throw a botocore.exceptions.ClientError for any of
     # the specific exceptions for the 'GetSecretValue' API.
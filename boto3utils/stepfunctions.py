@@ -1,24 +1,31 @@
-import boto3
 import json
 import logging
 
-from botocore.client import Config
-from botocore.vendored.requests.exceptions import ReadTimeout
+from boto3utils.metrics import Metrics
 from traceback import format_exc
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
 
 class stepfunctions(object):
-    def __init__(self, session=None):
+    def __init__(self, session=None, metrics: Optional[Metrics] = None):
+        # imported here to keep importing this module fast
+        import boto3
+        from botocore.client import Config
+
         config = Config(read_timeout=70)
         if session is None:
             self.sfn = boto3.client("stepfunctions", config=config)
         else:
             self.sfn = session.client("stepfunctions", config=config)
+        if metrics is not None:
+            metrics.attach(self.sfn)
 
     def run_activity(self, process, arn, **kwargs):
         """Run an activity around the process function provided"""
+        from botocore.vendored.requests.exceptions import ReadTimeout
+
         while True:
             logger.info("Querying for task")
             try:
@@ -0,0 +1,156 @@
+import logging
+import threading
+import time
+
+from boto3utils.metrics import THROTTLE_CODES
+
+logger = logging.getLogger(__name__)
+
+# key of the rate limited name in the botocore request context
+_NAME = "boto3utils_throttle_name"
+
+
+class _TokenBucket(object):
+    __slots__ = ("rate", "tokens", "last", "backed_off")
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = 1.0
+        self.last = time.monotonic()
+        self.backed_off = None
+
+
+class AdaptiveRateLimiter(object):
+    """
+    Client-side adaptive rate limiting of requests, per bucket or prefix
+
+    Each bucket (or key prefix, see prefix_depth) has a token bucket allowing
+    `rate` requests per second. The rate is cut by `backoff` when S3 asks to
+    slow down (SlowDown, 503), at most once every `backoff_interval` seconds so
+    a burst of throttled requests counts once, and increased again by
+    `increase` requests per second, every second, while requests succeed:
+    throughput stays close to what the service accepts rather than bursting
+    into errors.
+
+    A limiter is thread safe, and can be shared by several s3 objects to limit
+    their combined requests.
+    """
+
+    def __init__(
+        self,
+        rate: float = 100.0,
+        min_rate: float = 1.0,
+        max_rate: float = 5500.0,
+        backoff: float = 0.5,
+        increase: float = 10.0,
+        prefix_depth: int = 0,
+        backoff_interval: float = 1.0,
+    ):
+        """
+        :param rate: Initial requests per second of each bucket or prefix
+        :param min_rate: Lowest rate to back off to
+        :param max_rate: Highest rate to ramp up to
+        :param backoff: Factor applied to the rate when throttled
+        :param increase: Requests per second added to the rate every second of
+            successful requests
+        :param prefix_depth: Number of "/" separated parts of the key, after the
+            bucket name, that requests are limited by (0 limits whole buckets).
+            Only the directory part of a key is used, so objects at the root of
+            a bucket are limited with the bucket.
+        :param backoff_interval: Seconds after backing off during which further
+            throttled requests do not reduce the rate again
+        """
+        self.initial_rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.backoff = backoff
+        self.increase = increase
+        self.prefix_depth = prefix_depth
+        self.backoff_interval = backoff_interval
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def name(self, bucket, key="") -> str:
+        """Get the name requests for an object are limited by"""
+        if not self.prefix_depth:
+            return bucket
+        # the last part is the object name, or empty for a prefix ending in "/"
+        dirs = key.split("/")[:-1]
+        return "/".join([bucket] + dirs[: self.prefix_depth])
+
+    def rate(self, name) -> float:
+        """Get the current requests per second allowed for a name"""
+        with self._lock:
+            bucket = self._buckets.get(name)
+            return bucket.rate if bucket else self.initial_rate
+
+    def acquire(self, name):
+        """Wait until a request for name is allowed"""
+        with self._lock:
+            bucket = self._buckets.get(name)
+            if bucket is None:
+                bucket = self._buckets[name] = _TokenBucket(self.initial_rate)
+            now = time.monotonic()
+            # allow bursts of up to a second of requests
+            bucket.tokens = min(
+                max(bucket.rate, 1.0), bucket.tokens + (now - bucket.last) * bucket.rate
+            )
+            bucket.last = now
+            # take the token now, waiting for it if the bucket is in debt
+            bucket.tokens -= 1
+            wait = -bucket.tokens / bucket.rate if bucket.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+    def throttled(self, name):
+        """Reduce the rate for a name after a throttled request"""
+        with self._lock:
+            bucket = self._buckets.get(name)
+            if bucket is None:
+                return
+            # requests in flight when the rate was cut were sent at the old rate
+            now = time.monotonic()
+            if bucket.backed_off is None or (
+                now - bucket.backed_off >= self.backoff_interval
+            ):
+                bucket.backed_off = now
+                bucket.rate = max(self.min_rate, bucket.rate * self.backoff)
+                logger.debug("Throttled, limiting %s to %.1f/s" % (name, bucket.rate))
+
+    def succeeded(self, name):
+        """Increase the rate for a name after a successful request"""
+        with self._lock:
+            bucket = self._buckets.get(name)
+            if bucket is not None and bucket.rate < self.max_rate:
+                # rate successes a second raise the rate by increase a second
+                bucket.rate = min(
+                    self.max_rate, bucket.rate + self.increase / bucket.rate
+                )
+
+    def attach(self, client):
+        """Limit the requests made by a boto3 S3 client"""
+        events = client.meta.events
+        events.register("before-parameter-build.s3", self._before_parameter_build)
+        events.register("needs-retry.s3", self._needs_retry)
+        return client
+
+    def _before_parameter_build(self, params, context, **kwargs):
+        bucket = params.get("Bucket")
+        if not bucket:
+            return
+        name = self.name(bucket, params.get("Key") or params.get("Prefix") or "")
+        context[_NAME] = name
+        self.acquire(name)
+
+    def _needs_retry(self, response, request_dict, **kwargs):
+        name = request_dict.get("context", {}).get(_NAME)
+        if name is None or response is None:
+            return
+        code = response[1].get("Error", {}).get("Code")
+        status = response[0].status_code
+        if code in THROTTLE_CODES or status in (429, 503):
+            self.throttled(name)
+            # the retry is a request like any other
+            self.acquire(name)
+        elif status < 300:
+            self.succeeded(name)
@@ -34,5 +34,6 @@ setup(
     packages=find_packages(exclude=["docs", "tests*"]),
     include_package_data=True,
     install_requires=install_requires,
+    extras_require={"parquet": ["pyarrow"]},
     dependency_links=dependency_links,
 )
@@ -4,10 +4,20 @@ import moto
 import boto3
 import pytest
 
+from boto3utils.s3 import clear_clients
+
 if "AWS_DEFAULT_REGION" not in os.environ:
     os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
 
 
+@pytest.fixture(autouse=True)
+def shared_clients():
+    """Start every test without the clients and regions cached by boto3utils.s3"""
+    clear_clients()
+    yield
+    clear_clients()
+
+
 @pytest.fixture
 def aws_credentials():
     """Mocked AWS Credentials for moto."""
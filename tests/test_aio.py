@@ -0,0 +1,64 @@
+import asyncio
+import os
+import pytest
+
+from boto3utils.aio import AsyncS3
+from shutil import rmtree
+
+BUCKET = "testbucket"
+
+testpath = os.path.dirname(__file__)
+
+
+@pytest.fixture
+def s3mock(s3):
+    s3.create_bucket(Bucket=BUCKET)
+    for i in range(20):
+        s3.put_object(Body='{"id": %s}' % i, Bucket=BUCKET, Key="docs/%02d.json" % i)
+    yield s3
+
+
+def test_read_json(s3mock):
+    async def main():
+        async with AsyncS3(max_concurrency=4) as s3:
+            urls = ["s3://%s/docs/%02d.json" % (BUCKET, i) for i in range(20)]
+            return await asyncio.gather(*[s3.read_json(url) for url in urls])
+
+    assert asyncio.run(main()) == [{"id": i} for i in range(20)]
+
+
+def test_exists(s3mock):
+    async def main():
+        async with AsyncS3() as s3:
+            return (
+                await s3.exists("s3://%s/docs/00.json" % BUCKET),
+                await s3.exists("s3://%s/missing" % BUCKET),
+            )
+
+    assert asyncio.run(main()) == (True, False)
+
+
+def test_find(s3mock):
+    async def main():
+        async with AsyncS3() as s3:
+            return [url async for url in s3.find("s3://%s/docs/1" % BUCKET)]
+
+    assert asyncio.run(main()) == [
+        "s3://%s/docs/%s.json" % (BUCKET, i) for i in range(10, 20)
+    ]
+
+
+def test_upload_download(s3mock):
+    url = "s3://%s/mytestfile" % BUCKET
+    path = os.path.join(testpath, "test_aio/test_upload_download")
+
+    async def main():
+        async with AsyncS3() as s3:
+            await s3.upload(__file__, url)
+            assert await s3.exists(url)
+            return await s3.download(url, path)
+
+    fname = asyncio.run(main())
+    assert fname == os.path.join(path, "mytestfile")
+    assert os.path.exists(fname)
+    rmtree(path)
@@ -0,0 +1,31 @@
+import json
+import subprocess
+import sys
+
+# seconds allowed for importing all of boto3utils (importing boto3 alone is over this)
+IMPORT_BUDGET = 0.15
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import boto3utils
+from boto3utils import s3, secrets, s3inventory, stepfunctions, aio
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def _import():
+    output = subprocess.check_output([sys.executable, "-c", IMPORT_SCRIPT])
+    return json.loads(output)
+
+
+def test_no_heavy_imports():
+    modules = _import()["modules"]
+    for heavy in ["boto3", "botocore", "s3transfer", "dateutil"]:
+        assert heavy not in modules
+
+
+def test_import_time():
+    elapsed = min(_import()["elapsed"] for _ in range(3))
+    assert elapsed < IMPORT_BUDGET
@@ -0,0 +1,85 @@
+import json
+import moto
+import pytest
+
+from boto3utils import s3, secrets
+from boto3utils.metrics import Metrics
+from boto3utils.stepfunctions import stepfunctions
+
+BUCKET = "testbucket"
+
+
+@pytest.fixture
+def s3mock(s3):
+    s3.create_bucket(Bucket=BUCKET)
+    s3.put_object(Body="helloworld", Bucket=BUCKET, Key="key")
+    yield s3
+
+
+def test_s3_metrics(s3mock):
+    records = []
+    metrics = Metrics(callback=lambda op, record: records.append((op, record)))
+    client = s3(metrics=metrics)
+    assert client.s3 is not s3().s3
+
+    assert client.read("s3://%s/key" % BUCKET) == "helloworld"
+    assert client.exists("s3://%s/key" % BUCKET)
+    assert not client.exists("s3://%s/missing" % BUCKET)
+    client.upload_json({"a": 1}, "s3://%s/doc.json" % BUCKET)
+    list(client.find("s3://%s/" % BUCKET))
+
+    snapshot = metrics.snapshot()
+    assert set(snapshot) == {
+        "s3.GetObject",
+        "s3.HeadObject",
+        "s3.PutObject",
+        "s3.ListObjectsV2",
+    }
+    assert snapshot["s3.GetObject"]["calls"] == 1
+    assert snapshot["s3.GetObject"]["bytes_in"] == len("helloworld")
+    assert snapshot["s3.PutObject"]["bytes_out"] == len(json.dumps({"a": 1}))
+    assert snapshot["s3.HeadObject"]["calls"] == 2
+    assert snapshot["s3.HeadObject"]["errors"] == 1
+    latency = snapshot["s3.HeadObject"]["latency_ms"]
+    assert latency["count"] == 2
+    assert sum(latency["buckets"].values()) == 2
+    assert latency["sum"] >= latency["max"] > 0
+    assert len(records) == 5
+    assert records[0][0] == "s3.GetObject"
+
+    metrics.reset()
+    assert metrics.snapshot() == {}
+
+
+def test_metrics_disabled(s3mock):
+    client = s3()
+    assert client.metrics is None
+    assert client.read("s3://%s/key" % BUCKET) == "helloworld"
+
+
+def test_metrics_throttles():
+    class response(object):
+        status_code = 503
+
+    metrics = Metrics()
+    metrics._needs_retry(
+        (response(), {"Error": {"Code": "SlowDown"}}),
+        event_name="needs-retry.s3.GetObject",
+    )
+    metrics._needs_retry(None, event_name="needs-retry.s3.GetObject")
+    assert metrics.snapshot()["s3.GetObject"]["throttles"] == 1
+
+
+def test_secrets_metrics(secretsmanager):
+    secretsmanager.create_secret(Name="secret", SecretString='{"a": "b"}')
+    metrics = Metrics()
+    assert secrets.get_secret("secret", metrics=metrics) == {"a": "b"}
+    assert metrics.snapshot()["secrets-manager.GetSecretValue"]["calls"] == 1
+
+
+def test_stepfunctions_metrics(aws_credentials):
+    metrics = Metrics()
+    with moto.mock_stepfunctions():
+        sfn = stepfunctions(metrics=metrics)
+        sfn.sfn.list_state_machines()
+    assert metrics.snapshot()["sfn.ListStateMachines"]["calls"] == 1
@@ -1,10 +1,20 @@
 import boto3
+import copy
+import gc
+import json
 import os
+import pickle
 import pytest
+import sys
 
 from boto3utils import s3
+from boto3utils.cache import S3Cache
+from boto3utils.metrics import Metrics
+from datetime import datetime
 from shutil import rmtree
 
+s3module = sys.modules["boto3utils.s3"]
+
 BUCKET = "testbucket"
 BUCKET_WEST = "testbucket_west"
 KEY = "testkey"
@@ -195,3 +205,719 @@ def test_upload_download_with_custom_endpoint(s3_custom_endpoint):
     url = "s3://%s/mytestfile" % BUCKET
     s3(endpoint_url="http://my-s3").upload(__file__, url, public=True)
     assert s3(endpoint_url="http://my-s3").exists(url)
+
+
+def test_download_many(s3mock):
+    urls = ["s3://%s/%s" % (BUCKET, KEY), "s3://%s/test.json" % BUCKET]
+    path = os.path.join(testpath, "test_s3/test_download_many")
+    results = list(s3().download_many(urls + ["s3://%s/missing" % BUCKET], path))
+    assert len(results) == 3
+    for url, fname, error in results:
+        if url.endswith("missing"):
+            assert fname is None
+            assert error is not None
+        else:
+            assert error is None
+            assert fname == os.path.join(path, os.path.basename(url))
+            assert os.path.exists(fname)
+    assert not os.path.exists(os.path.join(path, "missing"))
+    rmtree(path)
+
+
+def test_download_many_bytes_in_flight(s3mock):
+    urls = ["s3://%s/%s" % (BUCKET, KEY)] * 5 + ["s3://%s/test.json" % BUCKET]
+    path = os.path.join(testpath, "test_s3/test_download_many")
+    results = list(
+        s3().download_many(urls, path, max_workers=4, max_bytes_in_flight=12)
+    )
+    assert len(results) == 6
+    assert all(error is None for _, _, error in results)
+    rmtree(path)
+
+
+def test_upload_many(s3mock, monkeypatch):
+    client = s3()
+    lookups = []
+    get_bucket_region = client.get_bucket_region
+    monkeypatch.setattr(
+        client,
+        "get_bucket_region",
+        lambda bucket: lookups.append(bucket) or get_bucket_region(bucket),
+    )
+    files = [(__file__, "s3://%s/upload_many/%s" % (BUCKET, i)) for i in range(5)]
+    files.append(("nosuchfile", "s3://%s/upload_many/missing" % BUCKET))
+    results = list(
+        client.upload_many(files, http_url=True, multipart_threshold=5 * 1024**2)
+    )
+    assert len(results) == 6
+    for (filename, url), url_out, error in results:
+        if filename == "nosuchfile":
+            assert url_out is None
+            assert isinstance(error, FileNotFoundError)
+        else:
+            assert error is None
+            assert url_out.startswith("https://%s.s3.us-east-1" % BUCKET)
+            assert client.exists(url)
+    assert lookups == [BUCKET]
+
+
+def test_upload_json(s3mock):
+    url = "s3://%s/upload_json.json" % BUCKET
+    data = {"field": "value", "list": [1, 2, 3]}
+    assert s3().upload_json(data, url) == url
+    assert s3().read_json(url) == data
+    obj = s3().get_object(BUCKET, "upload_json.json")
+    assert obj["ContentType"] == "application/json"
+
+
+def test_upload_json_compress(s3mock):
+    url = "s3://%s/upload_json_compress.json" % BUCKET
+    data = {"field": "value" * 100}
+
+    def dumps(data):
+        return json.dumps(data).encode("utf-8")
+
+    out = s3().upload_json(data, url, compress=True, dumps=dumps, http_url=True)
+    assert out == "https://%s.s3.us-east-1.amazonaws.com/upload_json_compress.json" % (
+        BUCKET
+    )
+    obj = s3().get_object(BUCKET, "upload_json_compress.json")
+    assert obj["ContentEncoding"] == "gzip"
+    assert obj["ContentLength"] < len(json.dumps(data))
+    assert s3().read_json(url) == data
+
+
+def test_read_stream(s3mock):
+    url = "s3://%s/test.json" % BUCKET
+    text = "".join(s3().read_stream(url, chunk_size=4))
+    assert text == s3().read(url)
+    lines = list(s3().iter_lines(url, chunk_size=4))
+    assert lines == s3().read(url).splitlines()
+
+
+def test_iter_lines_gzip(s3mock):
+    import gzip
+
+    lines = ["line %s é" % i for i in range(1000)]
+    # two concatenated gzip members, as written by some tools
+    body = gzip.compress("\n".join(lines[:500]).encode() + b"\n") + gzip.compress(
+        "\n".join(lines[500:]).encode() + b"\n"
+    )
+    s3mock.put_object(Bucket=BUCKET, Key="lines.txt.gz", Body=body)
+    url = "s3://%s/lines.txt.gz" % BUCKET
+    assert list(s3().iter_lines(url, chunk_size=100)) == lines
+    assert "".join(s3().read_stream(url, chunk_size=7)) == s3().read(url)
+
+
+def test_iter_lines_crlf(s3mock):
+    s3mock.put_object(Bucket=BUCKET, Key="crlf.txt", Body=b"l1\r\nl2\r\n\r\nl3\r")
+    url = "s3://%s/crlf.txt" % BUCKET
+    # chunk_size=3 splits the "\r\n" after l1 across chunks
+    assert list(s3().iter_lines(url, chunk_size=3)) == ["l1", "l2", "", "l3"]
+    assert list(s3().iter_lines(url)) == ["l1", "l2", "", "l3"]
+
+
+def test_read_json_lines(s3mock):
+    docs = [{"id": i} for i in range(10)]
+    body = "\n".join(json.dumps(d) for d in docs) + "\n\n"
+    s3mock.put_object(Bucket=BUCKET, Key="docs.ndjson", Body=body)
+    url = "s3://%s/docs.ndjson" % BUCKET
+    assert list(s3().read_json_lines(url, chunk_size=16)) == docs
+
+
+def test_read_range(s3mock):
+    url = "s3://%s/%s" % (BUCKET, KEY)
+    assert s3().read_range(url, 0, 4) == b"hello"
+    assert s3().read_range(url, 5) == b"world"
+
+
+def test_read_parallel(s3mock):
+    body = os.urandom(100000)
+    s3mock.put_object(Bucket=BUCKET, Key="large", Body=body)
+    url = "s3://%s/large" % BUCKET
+    assert s3().read_parallel(url, part_size=7000, max_workers=4) == body
+
+
+def test_download_parallel(s3mock):
+    body = os.urandom(100000)
+    s3mock.put_object(Bucket=BUCKET, Key="large", Body=body)
+    url = "s3://%s/large" % BUCKET
+    path = os.path.join(testpath, "test_s3/test_download_parallel")
+    fname = s3().download_parallel(url, path, part_size=7000, max_workers=4)
+    assert fname == os.path.join(path, "large")
+    with open(fname, "rb") as f:
+        assert f.read() == body
+    rmtree(path)
+
+
+def test_download_parallel_changed(s3mock):
+    s3mock.put_object(Bucket=BUCKET, Key="large", Body=os.urandom(10000))
+    url = "s3://%s/large" % BUCKET
+    path = os.path.join(testpath, "test_s3/test_download_parallel")
+    client = s3()
+    get_object = client.get_object
+
+    def overwrite_then_get(bucket, key, extra_args={}):
+        s3mock.put_object(Bucket=BUCKET, Key="large", Body=os.urandom(10000))
+        return get_object(bucket, key, extra_args=extra_args)
+
+    client.get_object = overwrite_then_get
+    with pytest.raises(Exception):
+        client.download_parallel(url, path, part_size=1000)
+    assert not os.path.exists(os.path.join(path, "large"))
+    rmtree(path)
+
+
+@pytest.fixture
+def s3mock_tree(s3mock):
+    for prefix in ["a/", "b/", "b/c/", "d/", ""]:
+        for i in range(25):
+            s3mock.put_object(Body="x", Bucket=BUCKET, Key=f"tree/{prefix}{i:02}.txt")
+    s3mock.put_object(Body="x", Bucket=BUCKET, Key="tree/a/skip.json")
+    yield s3mock
+
+
+def test_find_parallel(s3mock_tree):
+    url = "s3://%s/tree/" % BUCKET
+    expected = list(s3().find(url, suffix=".txt"))
+    assert len(expected) == 125
+    urls = list(s3().find_parallel(url, suffix=".txt", max_workers=2))
+    assert sorted(urls) == sorted(expected)
+
+
+def test_find_parallel_ordered(s3mock_tree):
+    url = "s3://%s/tree/" % BUCKET
+    expected = list(s3().find(url))
+    urls = s3().find_parallel(url, max_workers=2, ordered=True, max_pages_buffered=1)
+    assert list(urls) == expected
+
+
+def test_find_parallel_prefixes(s3mock_tree):
+    url = "s3://%s/tree/" % BUCKET
+    prefixes = ["tree/b/", "tree/a/"]
+    urls = list(s3().find_parallel(url, prefixes=prefixes, ordered=True))
+    assert urls == list(s3().find(url + "a/")) + list(s3().find(url + "b/"))
+
+
+def test_find_parallel_close(s3mock_tree):
+    url = "s3://%s/tree/" % BUCKET
+    urls = s3().find_parallel(url, max_workers=2, max_pages_buffered=1)
+    assert next(urls).startswith(url)
+    urls.close()
+
+
+def test_find_parallel_close_stops_listing(s3mock_tree):
+    metrics = Metrics()
+    url = "s3://%s/tree/" % BUCKET
+    prefixes = ["tree/a/"] + ["tree/missing/%03d/" % i for i in range(200)]
+    urls = s3(metrics=metrics).find_parallel(
+        url, prefixes=prefixes, max_workers=2, max_pages_buffered=1
+    )
+    assert next(urls).startswith(url + "a/")
+    urls.close()
+    # only the listings running when closed finish, the queued ones are dropped
+    assert metrics.snapshot()["s3.ListObjectsV2"]["calls"] <= 10
+
+
+def test_find_objects(s3mock_tree):
+    url = "s3://%s/tree/" % BUCKET
+    objects = list(s3().find_objects(url, suffix=".txt"))
+    assert [o.url for o in objects] == list(s3().find(url, suffix=".txt"))
+    head = s3mock_tree.head_object(Bucket=BUCKET, Key="tree/00.txt")
+    obj = objects[0]
+    assert obj.url == "s3://%s/tree/00.txt" % BUCKET
+    assert obj.size == 1
+    assert obj.etag == head["ETag"]
+    assert obj.last_modified == head["LastModified"]
+    assert obj.storage_class == "STANDARD"
+
+
+def test_find_objects_resume(s3mock_tree):
+    url = "s3://%s/tree/" % BUCKET
+    expected = list(s3().find_objects(url))
+    first = []
+    for obj in s3().find_objects(url):
+        first.append(obj)
+        if len(first) == 40:
+            break
+    rest = list(s3().find_objects(url, start_after=first[-1].url))
+    assert first + rest == expected
+
+
+def test_delete_many(s3mock_tree, monkeypatch):
+    monkeypatch.setattr(s3module, "DELETE_BATCH_SIZE", 10)
+    urls = list(s3().find("s3://%s/tree/b/" % BUCKET))
+    assert len(urls) == 50
+    errors = s3().delete_many(urls + ["s3://nosuchbucket/key"], max_workers=3)
+    assert errors == [
+        {
+            "url": "s3://nosuchbucket/key",
+            "code": "NoSuchBucket",
+            "message": errors[0]["message"],
+        }
+    ]
+    assert list(s3().find("s3://%s/tree/b/" % BUCKET)) == []
+    assert len(list(s3().find("s3://%s/tree/" % BUCKET))) == 76
+
+
+def test_delete_prefix(s3mock_tree, monkeypatch):
+    monkeypatch.setattr(s3module, "DELETE_BATCH_SIZE", 10)
+    url = "s3://%s/tree/" % BUCKET
+    assert s3().delete_prefix(url, suffix=".txt") == []
+    assert list(s3().find(url)) == ["s3://%s/tree/a/skip.json" % BUCKET]
+
+
+def test_get_bucket_region_cached(s3mock_west, monkeypatch):
+    client = s3()
+    calls = []
+    get_bucket_location = client.s3.get_bucket_location
+    monkeypatch.setattr(
+        client.s3,
+        "get_bucket_location",
+        lambda **kwargs: calls.append(kwargs) or get_bucket_location(**kwargs),
+    )
+    assert client.get_bucket_region(BUCKET_WEST) == "us-west-2"
+    assert s3().get_bucket_region(BUCKET_WEST) == "us-west-2"
+    assert len(calls) == 1
+
+
+def test_shared_clients(s3mock):
+    assert s3().s3 is s3().s3
+    assert s3().s3 is not s3(max_pool_connections=20).s3
+    assert s3().s3 is not s3(session=boto3.Session()).s3
+
+
+def test_session_clients_released(s3mock):
+    session = boto3.Session()
+    client = s3(session=session)
+    assert client.s3 is s3(session=session).s3
+    for _ in range(20):
+        s3(session=boto3.Session()).exists("s3://%s/%s" % (BUCKET, KEY))
+    gc.collect()
+    assert len(s3module._clients) + len(s3module._session_clients) <= 2
+    assert client.s3 is s3(session=session).s3
+
+
+def test_per_region_clients(s3mock_west):
+    client = s3(per_region_clients=True)
+    assert client._client(BUCKET_WEST).meta.region_name == "us-west-2"
+    assert client._client(BUCKET_WEST) is client._client(BUCKET_WEST)
+    assert client.exists("s3://%s/%s" % (BUCKET_WEST, KEY))
+    assert client.read("s3://%s/%s" % (BUCKET_WEST, KEY)) == "helloworld"
+
+
+PRESIGN_TIME = datetime(2024, 3, 7, 12, 30, 45)
+
+
+@pytest.fixture
+def presign_env(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "AKIDEXAMPLE")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "secret")
+    monkeypatch.setenv("AWS_SESSION_TOKEN", "token")
+    monkeypatch.delenv("AWS_REGION", raising=False)
+
+    class frozen_datetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return PRESIGN_TIME
+
+    monkeypatch.setattr(s3module, "datetime", frozen_datetime)
+
+
+def test_get_presigned_url(presign_env):
+    url, headers = s3module.get_presigned_url("s3://bucket/path/to/key.tif")
+    assert url == "https://bucket.s3.amazonaws.com/path/to/key.tif"
+    assert headers == {
+        "host": "bucket.s3.amazonaws.com",
+        "x-amz-content-sha256": "UNSIGNED-PAYLOAD",
+        "x-amz-date": "20240307T123045Z",
+        "x-amz-security-token": "token",
+        "Authorization": "AWS4-HMAC-SHA256 Credential=AKIDEXAMPLE/20240307/eu-central-1"
+        "/s3/aws4_request, SignedHeaders=host;x-amz-content-sha256;x-amz-date;"
+        "x-amz-security-token, Signature="
+        "cf5e5f982b46b4c8e8bace36d93fc0399e79f4fddce7d6a8b3f62ed4b4352f20",
+    }
+
+
+def test_get_presigned_url_options(presign_env):
+    url, headers = s3module.get_presigned_url(
+        "s3://bucket/path/to/key.tif",
+        aws_region="us-west-2",
+        rtype="PUT",
+        public=True,
+        requester_pays=True,
+        content_type="application/json",
+    )
+    assert url == "https://bucket.s3.amazonaws.com/path/to/key.tif"
+    assert headers["Authorization"] == (
+        "AWS4-HMAC-SHA256 Credential=AKIDEXAMPLE/20240307/us-west-2/s3/aws4_request, "
+        "SignedHeaders=host;x-amz-acl;x-amz-content-sha256;x-amz-date;"
+        "x-amz-request-payer;x-amz-security-token, Signature="
+        "187fb131972453d3a4a8a051ca9342c5bffed561e0119a6abbaad2f8e703851b"
+    )
+    assert headers["content-type"] == "application/json"
+
+
+def test_get_presigned_url_no_credentials(monkeypatch):
+    monkeypatch.delenv("AWS_ACCESS_KEY_ID", raising=False)
+    monkeypatch.delenv("AWS_BUCKET_ACCESS_KEY_ID", raising=False)
+    url = "s3://bucket/key"
+    assert s3module.get_presigned_url(url) == (url, None)
+
+
+def test_presigner_sign_many(presign_env):
+    urls = ["s3://bucket/key%s" % i for i in range(3)]
+    presigner = s3module.Presigner.from_env()
+    signed = presigner.sign_many(urls, requester_pays=True)
+    assert signed == [
+        s3module.get_presigned_url(url, requester_pays=True) for url in urls
+    ]
+
+
+def _reference_urlparse(url):
+    """s3.urlparse as originally implemented, to check the fast path against"""
+    from urllib.parse import parse_qs, urlparse
+
+    _url = url
+    if url.startswith("https"):
+        _url = s3.https_to_s3(url)
+    if not url.startswith("s3://"):
+        raise Exception(f"Invalid S3 url {_url}")
+    parsed = urlparse(_url)
+    query_params = parse_qs(parsed.query or "")
+    for key in query_params:
+        if len(query_params[key]) == 1:
+            query_params[key] = query_params[key][0]
+    return {
+        "bucket": parsed.netloc,
+        "key": parsed.path.removeprefix("/"),
+        "filename": os.path.basename(parsed.path),
+        "parameters": query_params,
+    }
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "s3://bucket",
+        "s3://bucket/",
+        "s3://bucket/key",
+        "s3://bucket//key",
+        "s3://bucket/prefix/",
+        "s3://bucket/prefix/file.json",
+        "s3://bucket/a/b/c/d/e/file.tar.gz",
+        "s3:///key",
+        "s3://bucket.with.dots/key with spaces/file name.txt",
+        "s3://bucket/key=value/a,b;c@d:e/file",
+        "s3://user@bucket:443/key",
+        "s3://bucket/key%20encoded%2Fslash",
+        "s3://bucket/ключ/файл.txt",
+        "s3://bucket/key?VersionId=abc",
+        "s3://bucket/key?a=1&a=2&b=3",
+        "s3://bucket/key?",
+        "s3://bucket/key#fragment",
+        "s3://bucket/key?a=1#fragment",
+        "s3://bucket/tab\there",
+        "s3://bucket/new\nline",
+        "s3://bucket/semi;colon",
+    ],
+)
+def test_urlparse_equivalence(url):
+    assert dict(s3.urlparse(url)) == _reference_urlparse(url)
+    # repeated (cached) calls give the same answer
+    assert dict(s3.urlparse(url)) == _reference_urlparse(url)
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "invalid",
+        "",
+        "S3://bucket/key",
+        " s3://bucket/key",
+        "https://bucket.s3.amazonaws.com/key",
+    ],
+)
+def test_urlparse_equivalence_invalid(url):
+    with pytest.raises(Exception) as expected:
+        _reference_urlparse(url)
+    with pytest.raises(Exception) as error:
+        s3.urlparse(url)
+    assert str(error.value) == str(expected.value)
+
+
+def test_urlparse_immutable():
+    parts = s3.urlparse("s3://bucket/key?a=1&a=2")
+    with pytest.raises(AttributeError):
+        parts.key = "other"
+    with pytest.raises(TypeError):
+        parts["key"] = "other"
+    parts["parameters"]["a"].append("3")
+    parts["parameters"]["b"] = "4"
+    assert s3.urlparse("s3://bucket/key?a=1&a=2")["parameters"] == {"a": ["1", "2"]}
+    assert parts.bucket == "bucket"
+    assert parts.key == "key"
+
+    for other in (
+        copy.copy(parts),
+        copy.deepcopy(parts),
+        pickle.loads(pickle.dumps(parts)),
+    ):
+        assert type(other) is type(parts)
+        assert other == parts
+        assert other["parameters"] == {"a": ["1", "2"]}
+        with pytest.raises(AttributeError):
+            other.key = "other"
+
+
+def _write_tree(path, files):
+    for name, content in files.items():
+        fname = os.path.join(path, name)
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        with open(fname, "w") as f:
+            f.write(content)
+
+
+def test_sync_upload(s3mock):
+    path = os.path.join(testpath, "test_s3/test_sync_upload")
+    _write_tree(path, {"a.txt": "a", "sub/b.txt": "b", "sub/deeper/c.txt": "c"})
+    s3mock.put_object(Body="extra", Bucket=BUCKET, Key="sync/extra.txt")
+    url = "s3://%s/sync" % BUCKET
+
+    report = s3().sync(path, url, delete=True, dry_run=True)
+    assert len(report["transfer"]) == 3
+    assert report["delete"] == ["s3://%s/sync/extra.txt" % BUCKET]
+    assert not s3().exists("s3://%s/sync/a.txt" % BUCKET)
+
+    report = s3().sync(path, url, delete=True)
+    assert report["errors"] == []
+    assert sorted(s3().find(url)) == [
+        "s3://%s/sync/%s" % (BUCKET, name)
+        for name in ["a.txt", "sub/b.txt", "sub/deeper/c.txt"]
+    ]
+    assert s3().read("s3://%s/sync/sub/deeper/c.txt" % BUCKET) == "c"
+
+    # nothing changed
+    report = s3().sync(path, url, delete=True)
+    assert report == {"transfer": [], "delete": [], "errors": []}
+
+    _write_tree(path, {"a.txt": "changed"})
+    report = s3().sync(path, url, checksum=True)
+    assert report["transfer"] == [(os.path.join(path, "a.txt"), url + "/a.txt")]
+    assert s3().read(url + "/a.txt") == "changed"
+    rmtree(path)
+
+
+def test_sync_download(s3mock):
+    path = os.path.join(testpath, "test_s3/test_sync_download")
+    _write_tree(path, {"extra.txt": "extra"})
+    for key in ["a.txt", "sub/b.txt"]:
+        s3mock.put_object(Body=key, Bucket=BUCKET, Key="sync/" + key)
+    url = "s3://%s/sync/" % BUCKET
+
+    report = s3().sync(url, path, delete=True)
+    assert report["transfer"] == [
+        (url + "a.txt", os.path.join(path, "a.txt")),
+        (url + "sub/b.txt", os.path.join(path, "sub/b.txt")),
+    ]
+    assert report["delete"] == [os.path.join(path, "extra.txt")]
+    assert report["errors"] == []
+    with open(os.path.join(path, "sub/b.txt")) as f:
+        assert f.read() == "sub/b.txt"
+    assert not os.path.exists(os.path.join(path, "extra.txt"))
+
+    # nothing changed
+    assert s3().sync(url, path)["transfer"] == []
+    assert s3().sync(url, path, checksum=True)["transfer"] == []
+    rmtree(path)
+
+
+def test_sync_invalid():
+    with pytest.raises(Exception):
+        s3().sync("local", "other")
+
+
+def test_sync_missing_source(s3mock):
+    s3mock.put_object(Body="keep", Bucket=BUCKET, Key="sync/keep.txt")
+    path = os.path.join(testpath, "test_s3/does-not-exist")
+    with pytest.raises(FileNotFoundError):
+        s3().sync(path, "s3://%s/sync" % BUCKET, delete=True)
+    assert s3().exists("s3://%s/sync/keep.txt" % BUCKET)
+
+
+def test_copy(s3mock):
+    src = "s3://%s/test.json" % BUCKET
+    dst = "s3://%s/copy/test.json" % BUCKET
+    assert s3().copy(src, dst) == dst
+    assert s3().read_json(dst) == s3().read_json(src)
+
+
+def test_copy_multipart(s3mock):
+    body = os.urandom(12 * 1024**2)
+    s3mock.put_object(
+        Bucket=BUCKET,
+        Key="large",
+        Body=body,
+        ContentType="image/tiff",
+        Metadata={"a": "b"},
+    )
+    dst = "s3://%s/copy/large" % BUCKET
+    out = s3().copy(
+        "s3://%s/large" % BUCKET,
+        dst,
+        multipart_threshold=5 * 1024**2,
+        part_size=5 * 1024**2,
+    )
+    assert out == dst
+    obj = s3mock.get_object(Bucket=BUCKET, Key="copy/large")
+    assert obj["Body"].read() == body
+    assert obj["ContentType"] == "image/tiff"
+    assert obj["Metadata"] == {"a": "b"}
+
+
+def test_copy_multipart_copy_object_arguments(s3mock):
+    body = os.urandom(12 * 1024**2)
+    etag = s3mock.put_object(
+        Bucket=BUCKET,
+        Key="large",
+        Body=body,
+        ContentType="image/tiff",
+        Metadata={"a": "b"},
+    )["ETag"]
+    dst = "s3://%s/copy/large" % BUCKET
+    s3().copy(
+        "s3://%s/large" % BUCKET,
+        dst,
+        extra={
+            "MetadataDirective": "REPLACE",
+            "Metadata": {"c": "d"},
+            "TaggingDirective": "COPY",
+            "CopySourceIfMatch": etag,
+        },
+        multipart_threshold=5 * 1024**2,
+        part_size=5 * 1024**2,
+    )
+    obj = s3mock.get_object(Bucket=BUCKET, Key="copy/large")
+    assert obj["Body"].read() == body
+    assert obj["Metadata"] == {"c": "d"}
+    assert obj["ContentType"] != "image/tiff"
+
+
+def test_copy_without_head(s3mock, monkeypatch):
+    client = s3()
+    monkeypatch.setattr(client.s3, "head_object", None)
+    pairs = [("s3://%s/%s" % (BUCKET, KEY), "s3://%s/nohead/%s" % (BUCKET, KEY))]
+    assert [error for _, _, error in client.copy_many(pairs)] == [None]
+    assert client.read(pairs[0][1]) == "helloworld"
+
+
+def test_copy_too_large_falls_back_to_multipart(s3mock, monkeypatch):
+    from botocore.exceptions import ClientError
+
+    body = os.urandom(12 * 1024**2)
+    s3mock.put_object(Bucket=BUCKET, Key="large", Body=body)
+    monkeypatch.setattr(s3module, "MAX_COPY_SIZE", 5 * 1024**2)
+    client = s3()
+
+    def copy_object(**kwargs):
+        error = {"Error": {"Code": "InvalidRequest", "Message": "too large"}}
+        raise ClientError(error, "CopyObject")
+
+    monkeypatch.setattr(client.s3, "copy_object", copy_object)
+    dst = "s3://%s/copy/large" % BUCKET
+    out = client.copy(
+        "s3://%s/large" % BUCKET,
+        dst,
+        multipart_threshold=5 * 1024**2,
+        part_size=5 * 1024**2,
+    )
+    assert out == dst
+    assert s3mock.get_object(Bucket=BUCKET, Key="copy/large")["Body"].read() == body
+
+
+def test_copy_many(s3mock):
+    pairs = [
+        ("s3://%s/%s" % (BUCKET, KEY), "s3://%s/copy/%s" % (BUCKET, KEY)),
+        ("s3://%s/missing" % BUCKET, "s3://%s/copy/missing" % BUCKET),
+    ]
+    results = {pair: (dst, error) for pair, dst, error in s3().copy_many(pairs)}
+    assert results[pairs[0]] == (pairs[0][1], None)
+    assert results[pairs[1]][0] is None
+    assert results[pairs[1]][1] is not None
+    assert s3().read(pairs[0][1]) == "helloworld"
+
+
+def test_copy_prefix(s3mock_tree):
+    src = "s3://%s/tree/b/" % BUCKET
+    dst = "s3://%s/copied/" % BUCKET
+    results = list(s3().copy_prefix(src, dst, suffix=".txt", max_workers=4))
+    assert len(results) == 50
+    assert all(error is None for _, _, error in results)
+    assert sorted(s3().find(dst)) == sorted(
+        url.replace(src, dst) for url in s3().find(src)
+    )
+
+
+def test_cache(s3mock, tmp_path):
+    cache = S3Cache(str(tmp_path / "cache"))
+    client = s3(cache=cache)
+    calls = []
+    get_object = client.get_object
+
+    def counted(bucket, key, extra_args={}):
+        calls.append(extra_args)
+        return get_object(bucket, key, extra_args=extra_args)
+
+    client.get_object = counted
+    url = "s3://%s/test.json" % BUCKET
+    assert client.read_json(url) == {"field": "value"}
+    assert calls == [{}]
+    # revalidated with a conditional GET
+    assert client.read_json(url) == {"field": "value"}
+    assert "IfNoneMatch" in calls[1]
+
+    s3mock.put_object(Bucket=BUCKET, Key="test.json", Body='{"field": "changed"}')
+    assert client.read_json(url) == {"field": "changed"}
+
+    path = str(tmp_path / "download")
+    fname = client.download(url, path)
+    with open(fname) as f:
+        assert json.load(f) == {"field": "changed"}
+    assert len(calls) == 4
+
+
+def test_cache_ttl(s3mock, tmp_path):
+    client = s3(cache=S3Cache(str(tmp_path), ttl=60))
+    url = "s3://%s/%s" % (BUCKET, KEY)
+    assert client.read(url) == "helloworld"
+    s3mock.put_object(Bucket=BUCKET, Key=KEY, Body="changed")
+    # still within the TTL
+    assert client.read(url) == "helloworld"
+
+
+def test_cache_evict(s3mock, tmp_path):
+    cache = S3Cache(str(tmp_path), max_bytes=25)
+    client = s3(cache=cache)
+    for i in range(5):
+        s3mock.put_object(Bucket=BUCKET, Key="evict/%s" % i, Body="0123456789")
+        assert client.read("s3://%s/evict/%s" % (BUCKET, i)) == "0123456789"
+    cached = [f for f in os.listdir(tmp_path) if not f.endswith(".json")]
+    assert len(cached) == 2
+
+
+def test_cache_evict_only_when_full(s3mock, tmp_path, monkeypatch):
+    cache = S3Cache(str(tmp_path), max_bytes=1000)
+    client = s3(cache=cache)
+    scans = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda: scans.append(1) or evict())
+    url = "s3://%s/%s" % (BUCKET, KEY)
+    for _ in range(5):
+        assert client.read(url) == "helloworld"
+    # one scan to learn the size of the cache, none for unchanged objects
+    assert len(scans) == 1
+    for i in range(5):
+        s3mock.put_object(Bucket=BUCKET, Key="evict/%s" % i, Body="x" * 300)
+        client.read("s3://%s/evict/%s" % (BUCKET, i))
+    assert len(scans) == 3
+    assert cache._size <= 1000
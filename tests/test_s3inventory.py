@@ -1,9 +1,153 @@
+import csv
+import gzip
+import io
+import json
+import sys
+from datetime import date, datetime
+
 import pytest
 
-from boto3utils.s3inventory import S3Inventory
+from boto3utils import s3 as S3
+from boto3utils.s3inventory import InventoryChange, S3Inventory, compile_filter
 
 DATE = "2022-10-31"
 
+INVENTORY_BUCKET = "inventory-bucket"
+SOURCE_BUCKET = "source-bucket"
+INVENTORY_URL = f"s3://{INVENTORY_BUCKET}/{SOURCE_BUCKET}/daily"
+INVENTORY_DATE = "2024-01-02"
+SCHEMA = "Bucket, Key, Size, LastModifiedDate, ETag, StorageClass, IsLatest"
+
+# keys that a naive split on commas and quotes gets wrong
+AWKWARD_KEYS = ["odd/with,comma.json", 'odd/with "quotes".json', "odd/new\nline.json"]
+
+
+def inventory_rows(n=40):
+    rows = []
+    for i in range(n):
+        key = f"data/{i % 4:02d}/{i:04d}.{'json' if i % 2 else 'txt'}"
+        rows.append(
+            [
+                SOURCE_BUCKET,
+                key,
+                str(100 + i),
+                f"2024-01-{1 + i % 28:02d}T12:00:00.000Z",
+                f"etag{i}",
+                "STANDARD",
+                "false" if i % 10 == 9 else "true",
+            ]
+        )
+    for key in AWKWARD_KEYS:
+        rows.append(
+            [
+                SOURCE_BUCKET,
+                key,
+                "1",
+                "2024-01-01T00:00:00.000Z",
+                "e",
+                "STANDARD",
+                "true",
+            ]
+        )
+    return rows
+
+
+def write_inventory(s3, date, rows, nfiles=2, schema=SCHEMA):
+    """Write a CSV inventory, with a manifest, for the source bucket to moto"""
+    prefix = f"{SOURCE_BUCKET}/daily"
+    files = []
+    for n in range(nfiles):
+        text = io.StringIO()
+        csv.writer(text, quoting=csv.QUOTE_ALL, lineterminator="\n").writerows(
+            rows[n::nfiles]
+        )
+        body = gzip.compress(text.getvalue().encode())
+        key = f"{prefix}/data/{date}-{n}.csv.gz"
+        s3.put_object(Bucket=INVENTORY_BUCKET, Key=key, Body=body)
+        files.append({"key": key, "size": len(body), "MD5checksum": f"md5-{date}-{n}"})
+    manifest = {
+        "sourceBucket": SOURCE_BUCKET,
+        "fileFormat": "CSV",
+        "fileSchema": schema,
+        "files": files,
+    }
+    s3.put_object(
+        Bucket=INVENTORY_BUCKET,
+        Key=f"{prefix}/{date}T01-00Z/manifest.json",
+        Body=json.dumps(manifest),
+    )
+
+
+def write_columnar_inventory(s3, date, rows, file_format="Parquet", nfiles=2):
+    """Write a Parquet or ORC inventory, with a manifest, to moto"""
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.orc
+    import pyarrow.parquet
+
+    prefix = f"{SOURCE_BUCKET}/daily"
+    ext = "parquet" if file_format == "Parquet" else "orc"
+    write = pyarrow.parquet.write_table if ext == "parquet" else pyarrow.orc.write_table
+    files = []
+    for n in range(nfiles):
+        part = rows[n::nfiles]
+        table = pa.table(
+            {
+                "bucket": [r[0] for r in part],
+                "key": [r[1] for r in part],
+                "size": [int(r[2]) for r in part],
+                "last_modified_date": pa.array(
+                    [datetime.strptime(r[3], "%Y-%m-%dT%H:%M:%S.%fZ") for r in part],
+                    pa.timestamp("ms", tz="UTC"),
+                ),
+                "e_tag": [r[4] for r in part],
+                "storage_class": [r[5] for r in part],
+                "is_latest": [r[6] == "true" for r in part],
+            }
+        )
+        body = io.BytesIO()
+        write(table, body)
+        key = f"{prefix}/data/{date}-{n}.{ext}"
+        s3.put_object(Bucket=INVENTORY_BUCKET, Key=key, Body=body.getvalue())
+        files.append({"key": key, "size": body.tell(), "MD5checksum": f"md5-{n}"})
+    if file_format == "Parquet":
+        schema = (
+            "message s3.inventory { required binary bucket (STRING); "
+            "required binary key (STRING); optional int64 size; "
+            "optional int64 last_modified_date (TIMESTAMP(MILLIS,true)); "
+            "optional binary e_tag (STRING); optional binary storage_class (STRING); "
+            "optional boolean is_latest;}"
+        )
+    else:
+        schema = (
+            "struct<bucket:string,key:string,size:bigint,last_modified_date:timestamp,"
+            "e_tag:string,storage_class:string,is_latest:boolean>"
+        )
+    manifest = {
+        "sourceBucket": SOURCE_BUCKET,
+        "fileFormat": file_format,
+        "fileSchema": schema,
+        "files": files,
+    }
+    s3.put_object(
+        Bucket=INVENTORY_BUCKET,
+        Key=f"{prefix}/{date}T01-00Z/manifest.json",
+        Body=json.dumps(manifest),
+    )
+
+
+@pytest.fixture(params=["Parquet", "ORC"])
+def columnar_inventory(s3, request):
+    s3.create_bucket(Bucket=INVENTORY_BUCKET)
+    write_columnar_inventory(s3, INVENTORY_DATE, inventory_rows(), request.param)
+    yield S3Inventory(INVENTORY_URL, date=INVENTORY_DATE)
+
+
+@pytest.fixture
+def inventory(s3):
+    s3.create_bucket(Bucket=INVENTORY_BUCKET)
+    write_inventory(s3, INVENTORY_DATE, inventory_rows())
+    yield S3Inventory(INVENTORY_URL, date=INVENTORY_DATE)
+
 
 @pytest.fixture
 def test_inventory():
@@ -23,3 +167,322 @@ def _test_init_s3inventory(test_inventory):
 def _test_inventory_files(test_inventory):
     filenames = test_inventory.inventory_file_hrefs()
     assert len(filenames) == 1258
+
+
+def test_read_manifest(inventory):
+    assert inventory.manifest["datetime"] == f"{INVENTORY_DATE}T01-00Z"
+    assert inventory.schema[:2] == ["Bucket", "Key"]
+    assert len(inventory.inventory_file_hrefs()) == 2
+
+
+def test_iter_inventory_file(inventory):
+    rows = []
+    for href in inventory.inventory_file_hrefs():
+        rows += inventory.iter_inventory_file(
+            href, inventory.schema, s3client=inventory.s3client
+        )
+    assert len(rows) == len(inventory_rows())
+    assert sorted(r.Key for r in rows) == sorted(r[1] for r in inventory_rows())
+    row = next(r for r in rows if r.Key == "data/00/0000.txt")
+    assert row.Bucket == SOURCE_BUCKET
+    assert row.Size == "100"
+    assert row.IsLatest == "true"
+
+
+def test_iter_inventory_file_skips_bad_rows(s3):
+    s3.create_bucket(Bucket=INVENTORY_BUCKET)
+    body = gzip.compress(b'"b","k1","1"\n\n"b","short"\n"b","k,2","2"\n')
+    s3.put_object(Bucket=INVENTORY_BUCKET, Key="inv.csv.gz", Body=body)
+    rows = list(
+        S3Inventory.iter_inventory_file(
+            f"s3://{INVENTORY_BUCKET}/inv.csv.gz", ["Bucket", "Key", "Size"]
+        )
+    )
+    assert [tuple(r) for r in rows] == [("b", "k1", "1"), ("b", "k,2", "2")]
+
+
+def test_read_inventory_file(inventory):
+    href = inventory.inventory_file_hrefs()[0]
+    rows = inventory.read_inventory_file(
+        href, inventory.schema, s3client=inventory.s3client
+    )
+    assert len(rows) == len(inventory_rows()) // 2 + 1
+    assert set(rows[0]) == set(inventory.schema)
+
+
+def test_filter_inventory_file(inventory):
+    urls = []
+    for href in inventory.inventory_file_hrefs():
+        urls += inventory.filter_inventory_file(
+            href, inventory.schema, s3client=inventory.s3client, prefix="odd/"
+        )
+    assert sorted(urls) == sorted(f"s3://{SOURCE_BUCKET}/{k}" for k in AWKWARD_KEYS)
+
+
+FILTERS = dict(
+    suffix=".json",
+    start_date=date(2024, 1, 2),
+    end_date=date(2024, 1, 20),
+    is_latest=True,
+    key_contains=["data/"],
+)
+
+
+def test_filter_inventory_file_options(inventory):
+    href = inventory.inventory_file_hrefs()[1]
+    urls = list(
+        inventory.filter_inventory_file(
+            href,
+            inventory.schema,
+            s3client=inventory.s3client,
+            **FILTERS,
+        )
+    )
+    expected = [
+        f"s3://{SOURCE_BUCKET}/{r[1]}"
+        for r in inventory_rows()[1::2]
+        if r[1].startswith("data/")
+        and r[1].endswith(".json")
+        and "2024-01-02" < r[3][:10] < "2024-01-20"
+        and r[6] != "false"
+    ]
+    assert expected
+    assert urls == expected
+
+
+def test_columnar_schema(columnar_inventory):
+    assert columnar_inventory.file_format in ("Parquet", "ORC")
+    assert columnar_inventory.schema == [
+        "bucket",
+        "key",
+        "size",
+        "last_modified_date",
+        "e_tag",
+        "storage_class",
+        "is_latest",
+    ]
+
+
+def test_iter_columnar_inventory_file(columnar_inventory):
+    inv = columnar_inventory
+    rows = []
+    for href in inv.inventory_file_hrefs():
+        rows += inv.iter_inventory_file(href, ["key", "size"], s3client=inv.s3client)
+    assert len(rows) == len(inventory_rows())
+    assert sorted(r.key for r in rows) == sorted(r[1] for r in inventory_rows())
+    assert next(r for r in rows if r.key == "data/00/0000.txt").size == 100
+
+    href = inv.inventory_file_hrefs()[0]
+    rows = inv.read_inventory_file(href, inv.schema, s3client=inv.s3client)
+    assert rows[0]["bucket"] == SOURCE_BUCKET
+    assert set(rows[0]) == set(inv.schema)
+
+
+def test_filter_columnar_inventory_file(columnar_inventory, inventory):
+    """Filters select the same objects from Parquet or ORC as from CSV"""
+    urls, expected = [], []
+    for href in columnar_inventory.inventory_file_hrefs():
+        urls += columnar_inventory.filter_inventory_file(
+            href,
+            columnar_inventory.schema,
+            s3client=columnar_inventory.s3client,
+            **FILTERS,
+        )
+    for href in inventory.inventory_file_hrefs():
+        expected += inventory.filter_inventory_file(
+            href, inventory.schema, s3client=inventory.s3client, **FILTERS
+        )
+    assert expected
+    assert urls == expected
+
+
+def test_filter_columnar_inventory_prefix(columnar_inventory):
+    urls = []
+    for href in columnar_inventory.inventory_file_hrefs():
+        urls += columnar_inventory.filter_inventory_file(
+            href, columnar_inventory.schema, prefix="odd/"
+        )
+    assert sorted(urls) == sorted(f"s3://{SOURCE_BUCKET}/{k}" for k in AWKWARD_KEYS)
+
+
+def test_scan(inventory):
+    expected = []
+    for href in inventory.inventory_file_hrefs():
+        expected += inventory.filter_inventory_file(href, inventory.schema, **FILTERS)
+    calls = []
+    urls = list(
+        inventory.scan(FILTERS, workers=2, progress=lambda *args: calls.append(args))
+    )
+    assert sorted(urls) == sorted(expected)
+    assert sorted(c[0] for c in calls) == [1, 2]
+    assert {c[2] for c in calls} == set(inventory.inventory_file_hrefs())
+    assert sum(c[3] for c in calls) == len(expected)
+
+
+def test_scan_ordered(inventory):
+    urls = list(inventory.scan({"prefix": "data/"}, workers=2, ordered=True))
+    rows = inventory_rows()
+    expected = [r for r in rows[0::2] + rows[1::2] if r[1].startswith("data/")]
+    assert urls == [f"s3://{SOURCE_BUCKET}/{r[1]}" for r in expected]
+
+
+def test_scan_s3_args(s3):
+    s3.create_bucket(Bucket=INVENTORY_BUCKET)
+    write_inventory(s3, INVENTORY_DATE, inventory_rows())
+    inv = S3Inventory(INVENTORY_URL, date=INVENTORY_DATE, requester_pays=True)
+    assert inv.s3_args == {"requester_pays": True}
+
+
+def filter_all(inv, **filters):
+    urls = []
+    for href in inv.inventory_file_hrefs():
+        urls += inv.filter_inventory_file(href, inv.schema, **filters)
+    return urls
+
+
+def test_snapshot(inventory, s3, tmp_path):
+    with inventory.snapshot(tmp_path) as snapshot:
+        assert len(snapshot) == len(inventory_rows())
+        assert sorted(snapshot.query(**FILTERS)) == sorted(
+            filter_all(inventory, **FILTERS)
+        )
+        assert sorted(snapshot.query(prefix="odd/")) == sorted(
+            filter_all(inventory, prefix="odd/")
+        )
+        # datetime bounds compare by date, as filter_inventory_file does
+        bounds = dict(
+            start_date=datetime(2024, 1, 2, 6), end_date=datetime(2024, 1, 5, 6)
+        )
+        assert sorted(snapshot.query(**bounds)) == sorted(
+            filter_all(inventory, **bounds)
+        )
+        assert list(snapshot.query(prefix="data/01/", suffix=".json")) == [
+            f"s3://{SOURCE_BUCKET}/data/01/{i:04d}.json" for i in range(1, 40, 4)
+        ]
+    assert len(list(tmp_path.iterdir())) == 1
+
+    # the same manifest uses the snapshot without reading the inventory files
+    for href in inventory.inventory_file_hrefs():
+        inventory.s3client.delete(href)
+    with inventory.snapshot(tmp_path) as snapshot:
+        assert len(snapshot) == len(inventory_rows())
+
+
+def test_snapshot_changed_manifest(inventory, s3, tmp_path):
+    inventory.snapshot(tmp_path).close()
+    write_inventory(s3, INVENTORY_DATE, inventory_rows(10))
+    # a new inventory has new checksums for its files
+    inventory.manifest["files"][0]["MD5checksum"] = "changed"
+    with inventory.snapshot(tmp_path) as snapshot:
+        assert len(snapshot) == 10 + len(AWKWARD_KEYS)
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_columnar_snapshot(columnar_inventory, inventory, tmp_path):
+    with columnar_inventory.snapshot(tmp_path) as snapshot:
+        assert len(snapshot) == len(inventory_rows())
+        assert sorted(snapshot.query(**FILTERS)) == sorted(
+            filter_all(inventory, **FILTERS)
+        )
+
+
+def test_compile_filter():
+    schema = [f.strip() for f in SCHEMA.split(",")]
+    assert compile_filter(schema) is None
+    predicate = compile_filter(schema, **FILTERS)
+    assert [r[1] for r in inventory_rows() if predicate(r)] == [
+        r[1]
+        for r in inventory_rows()
+        if r[1].startswith("data/")
+        and r[1].endswith(".json")
+        and "2024-01-02" < r[3][:10] < "2024-01-20"
+        and r[6] != "false"
+    ]
+    predicate = compile_filter(schema, start_date=datetime(2024, 1, 1, 23))
+    assert not predicate(inventory_rows()[0])
+    assert predicate(inventory_rows()[1])
+
+
+def test_s3_read_inventory_file(inventory):
+    """The deprecated s3.read_inventory_file() uses the same filters"""
+    href = inventory.inventory_file_hrefs()[1]
+    urls = list(S3().read_inventory_file(href, inventory.schema, **FILTERS))
+    assert urls == list(
+        inventory.filter_inventory_file(href, inventory.schema, **FILTERS)
+    )
+    latest = list(S3().read_inventory_file(href, inventory.schema, is_latest=True))
+    assert len(latest) == len([r for r in inventory_rows()[1::2] if r[6] != "false"])
+
+
+def changed_rows():
+    """inventory_rows() a day later, with objects added, removed and modified"""
+    rows = [r for r in inventory_rows() if r[1] != "data/02/0002.txt"]
+    rows[0] = rows[0][:4] + ["changed"] + rows[0][5:]
+    rows[1] = rows[1][:2] + ["999"] + rows[1][3:]
+    rows.append([SOURCE_BUCKET, "data/new.json", "5", "2024-01-02T00:00:00.000Z"])
+    rows[-1] += ["new", "STANDARD", "true"]
+    return rows
+
+
+@pytest.mark.parametrize("buffer_rows", [1000000, 5])
+def test_diff(inventory, s3, tmp_path, monkeypatch, buffer_rows):
+    monkeypatch.setattr(sys.modules["boto3utils.s3inventory"], "MAX_MERGE_RUNS", 3)
+    write_inventory(s3, "2024-01-03", changed_rows(), nfiles=3)
+    newer = S3Inventory(INVENTORY_URL, date="2024-01-03")
+
+    changes = list(newer.diff(INVENTORY_DATE, buffer_rows=buffer_rows, tmpdir=tmp_path))
+    url = f"s3://{SOURCE_BUCKET}/"
+    assert changes == [
+        InventoryChange("modified", url + "data/00/0000.txt", "100", "changed"),
+        InventoryChange("modified", url + "data/01/0001.json", "999", "etag1"),
+        InventoryChange("removed", url + "data/02/0002.txt", "102", "etag2"),
+        InventoryChange("added", url + "data/new.json", "5", "new"),
+    ]
+    assert list(tmp_path.iterdir()) == []
+    assert list(newer.diff(newer)) == []
+
+
+def test_diff_missing_date(inventory):
+    with pytest.raises(ValueError, match="No inventory manifest"):
+        list(inventory.diff("2023-06-01"))
+
+
+def test_missing_manifest(s3):
+    s3.create_bucket(Bucket=INVENTORY_BUCKET)
+    with pytest.raises(ValueError):
+        S3Inventory(INVENTORY_URL, date=INVENTORY_DATE)
+
+
+def test_diff_versioned(s3):
+    s3.create_bucket(Bucket=INVENTORY_BUCKET)
+    schema = "Bucket, Key, VersionId, IsLatest, IsDeleteMarker, Size, ETag"
+    old = [
+        [SOURCE_BUCKET, "a", "1", "true", "false", "1", "e1"],
+        [SOURCE_BUCKET, "b", "1", "true", "false", "1", "e1"],
+    ]
+    new = [
+        [SOURCE_BUCKET, "a", "2", "true", "false", "2", "e2"],
+        [SOURCE_BUCKET, "a", "1", "false", "false", "1", "e1"],
+        [SOURCE_BUCKET, "b", "2", "true", "true", "", ""],
+        [SOURCE_BUCKET, "b", "1", "false", "false", "1", "e1"],
+    ]
+    write_inventory(s3, "2024-01-01", old, schema=schema)
+    write_inventory(s3, "2024-01-02", new, schema=schema)
+    inv = S3Inventory(INVENTORY_URL, date="2024-01-02")
+    assert [(c.change, c.url) for c in inv.diff("2024-01-01")] == [
+        ("modified", f"s3://{SOURCE_BUCKET}/a"),
+        ("removed", f"s3://{SOURCE_BUCKET}/b"),
+    ]
+
+
+def test_diff_columnar(columnar_inventory, s3):
+    file_format = columnar_inventory.file_format
+    write_columnar_inventory(s3, "2024-01-03", changed_rows(), file_format)
+    newer = S3Inventory(INVENTORY_URL, date="2024-01-03")
+    changes = [(c.change, c.url.split("/", 3)[3]) for c in newer.diff(INVENTORY_DATE)]
+    assert changes == [
+        ("modified", "data/00/0000.txt"),
+        ("modified", "data/01/0001.json"),
+        ("removed", "data/02/0002.txt"),
+        ("added", "data/new.json"),
+    ]
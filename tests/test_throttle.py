@@ -0,0 +1,90 @@
+import threading
+import time
+import pytest
+
+from boto3utils import s3
+from boto3utils.throttle import AdaptiveRateLimiter
+
+BUCKET = "testbucket"
+
+
+class response(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+@pytest.fixture
+def s3mock(s3):
+    s3.create_bucket(Bucket=BUCKET)
+    s3.put_object(Body="helloworld", Bucket=BUCKET, Key="key")
+    yield s3
+
+
+def test_acquire_rate():
+    limiter = AdaptiveRateLimiter(rate=50)
+    start = time.monotonic()
+    for _ in range(26):
+        limiter.acquire("bucket")
+    # the first request is free, the other 25 come at 50 a second
+    assert 0.4 < time.monotonic() - start < 1.0
+
+
+def test_backoff_and_ramp_up():
+    limiter = AdaptiveRateLimiter(
+        rate=100, min_rate=10, max_rate=110, increase=100, backoff_interval=0
+    )
+    limiter.acquire("bucket")
+    limiter.throttled("bucket")
+    assert limiter.rate("bucket") == 50
+    for _ in range(3):
+        limiter.throttled("bucket")
+    assert limiter.rate("bucket") == 10
+    for _ in range(100):
+        limiter.succeeded("bucket")
+    assert limiter.rate("bucket") == 110
+    # other buckets are not affected
+    assert limiter.rate("other") == 100
+
+
+def test_prefix_names():
+    assert AdaptiveRateLimiter().name("bucket", "a/b/c") == "bucket"
+    limiter = AdaptiveRateLimiter(prefix_depth=2)
+    assert limiter.name("bucket", "a/b/c") == "bucket/a/b"
+    assert limiter.name("bucket", "a/b") == "bucket/a"
+    assert limiter.name("bucket", "a/b/") == "bucket/a/b"
+    # objects at the root share the bucket, rather than one name per object
+    assert limiter.name("bucket", "a") == "bucket"
+    assert limiter.name("bucket") == "bucket"
+
+
+def test_concurrent_throttles_back_off_once():
+    limiter = AdaptiveRateLimiter(rate=100, backoff_interval=0.2)
+    limiter.acquire("bucket")
+    threads = [
+        threading.Thread(target=limiter.throttled, args=("bucket",)) for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert limiter.rate("bucket") == 50
+    time.sleep(0.25)
+    limiter.throttled("bucket")
+    assert limiter.rate("bucket") == 25
+
+
+def test_s3_rate_limiter(s3mock):
+    limiter = AdaptiveRateLimiter(rate=100, increase=100)
+    client = s3(rate_limiter=limiter)
+    assert client.s3 is not s3().s3
+    assert client.read("s3://%s/key" % BUCKET) == "helloworld"
+    assert client.exists("s3://%s/key" % BUCKET)
+    assert limiter.rate(BUCKET) > 100
+
+    context = {}
+    limiter._before_parameter_build({"Bucket": BUCKET}, context)
+    limiter._needs_retry(
+        (response(503), {"Error": {"Code": "SlowDown"}}),
+        request_dict={"context": context},
+    )
+    assert limiter.rate(BUCKET) < 100